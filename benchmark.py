@@ -0,0 +1,452 @@
+"""Time the stages of the pipeline on synthetic corpora of several sizes.
+
+Corpora are generated offline from fulldataLabeled.txt: the words of each
+class are drawn from that class's word frequencies and the document lengths
+from the lengths of its documents. Every stage is timed on every corpus, and
+its best time, throughput and peak memory are written as JSON. When a baseline
+file from an earlier run is given, stages which became slower by more than the
+threshold are reported and the program exits with status 1.
+"""
+
+from argparse import ArgumentParser
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+import json
+import os
+from pathlib import Path
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from instrument import recorder
+import main
+from metrics import fscore
+from naive_bayes import NaiveBayesClassifier, sanitize
+from utils import Sampler, choices, get_rng
+
+
+def generate_corpus(seed_file: str, n_docs: int, seed=None) -> tuple:
+    """Generate a labeled corpus which resembles a seed corpus.
+
+    Parameters
+    ----------
+    seed_file : str
+        A file with one tab-separated document and label per line.
+    n_docs : int
+        Number of documents to generate.
+    seed : int | random.Random | None, optional
+        Seed for the generation, by default None. The labels, the lengths and
+        the words of each class are drawn from separate seeds derived from it.
+
+    Returns
+    -------
+    tuple[list[str], list[int]]
+        Corresponding lists of documents and labels.
+    """
+    x_seed, y_seed = main.get_x_y(seed_file)
+    words = {0: Counter(), 1: Counter()}
+    for x_i, y_i in zip(x_seed, y_seed):
+        words[y_i].update(x_i.split())
+    lengths = [len(x_i.split()) for x_i in x_seed]
+
+    rng = get_rng(seed)
+    label_seed, length_seed, *word_seeds = (rng.getrandbits(64) for _ in range(4))
+    labels = [
+        y_seed[i] for i in Sampler.uniform(len(y_seed), label_seed).sample(n_docs)
+    ]
+    doc_lengths = choices(lengths, [1] * len(lengths), n_docs, length_seed)
+    x = [None] * n_docs
+    for label in (0, 1):
+        population = list(words[label])
+        weights = [words[label][w] for w in population]
+        sampler = Sampler(weights, word_seeds[label])
+        for i, y_i in enumerate(labels):
+            if y_i == label:
+                x[i] = " ".join(population[j] for j in sampler.sample(doc_lengths[i]))
+
+    return x, labels
+
+
+@contextmanager
+def working_directory(path: str):
+    """Change the working directory for the duration of a block."""
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def stages(x: list, y: list, tmp_dir: str, resamples: int) -> dict:
+    """Return the stages to time on a corpus.
+
+    The first half of the corpus is the training set and the second half the
+    test set. Each stage is set up only when it is timed, and the classifiers
+    and predictions which several stages need are set up once.
+
+    Parameters
+    ----------
+    x : list[str]
+        The documents.
+    y : list[int]
+        The labels.
+    tmp_dir : str
+        Directory for the files written by the stages.
+    resamples : int
+        Number of bootstrap resamples.
+
+    Returns
+    -------
+    dict[str, Callable[[], tuple[Callable[[], Any], int, str, tuple[str, ...]]]]
+        For each stage, a function setting it up which returns a function
+        running it, the number of items it processes, their unit and the
+        phases its time is taken from, or an empty tuple for all of it.
+    """
+    n = len(x)
+    half = n // 2
+    x_train, y_train, x_test, y_test = x[:half], y[:half], x[half:], y[half:]
+
+    @lru_cache(maxsize=None)
+    def test_file() -> Path:
+        path = Path(tmp_dir) / "test.txt"
+        with open(path, "w") as f:
+            f.writelines(f"{x_i}\t{y_i}\n" for x_i, y_i in zip(x_test, y_test))
+        return path
+
+    @lru_cache(maxsize=None)
+    def classifier() -> NaiveBayesClassifier:
+        return NaiveBayesClassifier().fit(x_train, y_train)
+
+    @lru_cache(maxsize=None)
+    def systems() -> list:
+        return [
+            NaiveBayesClassifier(binary=binary, delta=delta).fit(x_train, y_train)
+            for binary in (False, True)
+            for delta in (0.5, 1)
+        ]
+
+    def load():
+        path = test_file()
+        return lambda: main.get_x_y(path), len(x_test), "docs", ()
+
+    def sanitize_all():
+        return lambda: [sanitize(x_i, False) for x_i in x], n, "docs", ()
+
+    def fit():
+        return (
+            lambda: NaiveBayesClassifier().fit(x_train, y_train),
+            half,
+            "docs",
+            (),
+        )
+
+    def predict():
+        clf = classifier()
+        return lambda: clf.predict(x_test), len(x_test), "docs", ()
+
+    def fscore_all():
+        predictions = classifier().predict(x_test)
+        return lambda: fscore(predictions, y_test), len(x_test), "labels", ()
+
+    def choices_all():
+        return lambda: choices(x, [1] * n, n, 0), n, "draws", ()
+
+    def bootstrap(method: str):
+        # Only resampling and scoring are timed, not loading the test set,
+        # predicting with the systems or writing the results
+        path, fitted = test_file(), systems()
+
+        def run() -> None:
+            b = main.b
+            main.b = resamples
+            try:
+                with working_directory(tmp_dir):
+                    main.bootstrap(
+                        path, fitted, seed=0, method=method, progress_every=0
+                    )
+            finally:
+                main.b = b
+
+        n_pairs = len(fitted) * (len(fitted) - 1) // 2
+        return run, n_pairs * resamples, "resamples", ("resample", "metric")
+
+    return {
+        "load": load,
+        "sanitize": sanitize_all,
+        "fit": fit,
+        "predict": predict,
+        "fscore": fscore_all,
+        "choices": choices_all,
+        "bootstrap": lambda: bootstrap("paired"),
+        "bootstrap_shared": lambda: bootstrap("shared"),
+    }
+
+
+def measure(
+    run, repeat: int, memory: bool, phases: tuple = (), min_time: float = 0.2
+) -> tuple:
+    """Time a function and measure its peak memory.
+
+    Each timed run calls the function as many times as it takes to run for at
+    least min_time, so that the time of a fast function is not dominated by
+    the resolution and the noise of the timer.
+
+    Parameters
+    ----------
+    run : Callable[[], Any]
+        The function.
+    repeat : int
+        Number of timed runs, of which the fastest is kept.
+    memory : bool
+        If true, run the function once more while tracing its allocations.
+    phases : tuple[str, ...], optional
+        Phases of the recorder to take the time from, by default (), which
+        times all of the function.
+    min_time : float, optional
+        Shortest time in seconds of a timed run, by default 0.2.
+
+    Returns
+    -------
+    tuple[float, int | None]
+        The best time of one call in seconds and the peak number of bytes
+        allocated, or None if memory is false.
+    """
+
+    def timed(number: int) -> float:
+        recorder.reset()
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        if phases:
+            return sum(recorder.timers.get(phase, 0.0) for phase in phases)
+        return time.perf_counter() - start
+
+    # Find the number of calls per timed run, like timeit's autorange
+    number = 1
+    elapsed = timed(number)
+    while elapsed < min_time:
+        number *= 10 if elapsed < min_time / 10 else 2
+        elapsed = timed(number)
+
+    seconds = [elapsed / number]
+    for _ in range(repeat - 1):
+        seconds.append(timed(number) / number)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return min(seconds), peak
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """Find the stages which became slower than in a baseline.
+
+    Parameters
+    ----------
+    results : list[dict]
+        The results of this run.
+    baseline : list[dict]
+        The results of an earlier run.
+    threshold : float
+        Largest allowed relative increase of a stage's time, e.g., 0.2 for 20%.
+
+    Returns
+    -------
+    list[tuple[dict, dict]]
+        The result and the baseline of each regressed stage.
+    """
+    old = {(r["stage"], r["n_docs"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = old.get((r["stage"], r["n_docs"]))
+        if b is not None and r["seconds"] > b["seconds"] * (1 + threshold):
+            regressions.append((r, b))
+    return regressions
+
+
+def benchmark(
+    seed_file: str,
+    scales: list,
+    output_file: str,
+    selected: list = None,
+    repeat: int = 3,
+    resamples: int = 100,
+    memory: bool = True,
+    baseline_file: str = None,
+    threshold: float = 0.2,
+    seed: int = 0,
+) -> bool:
+    """Time every stage on a synthetic corpus of every scale.
+
+    Parameters
+    ----------
+    seed_file : str
+        The labeled file the corpora resemble.
+    scales : list[int]
+        Number of documents of each corpus.
+    output_file : str
+        Location of the JSON results.
+    selected : list[str], optional
+        Names of the stages to time, by default None, which times all of them.
+    repeat : int, optional
+        Number of timed runs of each stage, by default 3.
+    resamples : int, optional
+        Number of bootstrap resamples, by default 100.
+    memory : bool, optional
+        If true, measure the peak memory of each stage, by default True.
+    baseline_file : str, optional
+        JSON results of an earlier run to compare against, by default None.
+    threshold : float, optional
+        Largest allowed relative slowdown of a stage, by default 0.2.
+    seed : int, optional
+        Seed for generating the corpora, by default 0.
+
+    Returns
+    -------
+    bool
+        True if no stage regressed.
+    """
+    results = []
+    for n_docs in scales:
+        x, y = generate_corpus(seed_file, n_docs, seed)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for stage, setup in stages(x, y, tmp_dir, resamples).items():
+                if selected and stage not in selected:
+                    continue
+                run, n_items, unit, phases = setup()
+                seconds, peak = measure(run, repeat, memory, phases)
+                results.append(
+                    {
+                        "stage": stage,
+                        "n_docs": n_docs,
+                        "seconds": seconds,
+                        "throughput": n_items / seconds if seconds else None,
+                        "unit": f"{unit}/s",
+                        "peak_bytes": peak,
+                    }
+                )
+                peak_mb = "-" if peak is None else f"{peak / 2**20:.1f} MB"
+                print(
+                    f"{stage:>16} {n_docs:>9} docs {seconds:11.6f} s "
+                    f"{n_items / seconds if seconds else 0:12.0f} {unit}/s {peak_mb:>10}"
+                )
+
+    with open(output_file, "w") as f:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+
+    if baseline_file is None:
+        return True
+    with open(baseline_file, "r") as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, threshold)
+    for r, b in regressions:
+        print(
+            f"Regression: {r['stage']} on {r['n_docs']} docs took "
+            f"{r['seconds']:.4f} s, baseline {b['seconds']:.4f} s."
+        )
+    return not regressions
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+
+    parser.add_argument(
+        "--seed-file",
+        action="store",
+        default="./fulldataLabeled.txt",
+        help="Unix-style path to the labeled file the corpora resemble.",
+    )
+    parser.add_argument(
+        "--scales",
+        action="store",
+        default="3000,30000,300000",
+        help="Comma-separated numbers of documents of the corpora.",
+    )
+    parser.add_argument(
+        "--stages",
+        action="store",
+        default=None,
+        help="Comma-separated names of the stages to time, by default all of "
+        "load, sanitize, fit, predict, fscore, choices, bootstrap and "
+        "bootstrap_shared.",
+    )
+    parser.add_argument(
+        "--output-file",
+        action="store",
+        default="./benchmark.json",
+        help="Unix-style path to the JSON results.",
+    )
+    parser.add_argument(
+        "--baseline-file",
+        action="store",
+        default=None,
+        help="Unix-style path to JSON results to compare against.",
+    )
+    parser.add_argument(
+        "--threshold",
+        action="store",
+        type=float,
+        default=0.2,
+        help="Largest allowed relative slowdown of a stage.",
+    )
+    parser.add_argument(
+        "--repeat",
+        action="store",
+        type=int,
+        default=3,
+        help="Number of timed runs of each stage.",
+    )
+    parser.add_argument(
+        "--resamples",
+        action="store",
+        type=int,
+        default=100,
+        help="Number of bootstrap resamples.",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skip measuring the peak memory of each stage.",
+    )
+    parser.add_argument(
+        "--seed",
+        action="store",
+        type=int,
+        default=0,
+        help="Seed for generating the corpora.",
+    )
+
+    args = parser.parse_args()
+
+    ok = benchmark(
+        args.seed_file,
+        [int(n) for n in args.scales.split(",")],
+        args.output_file,
+        args.stages.split(",") if args.stages else None,
+        args.repeat,
+        args.resamples,
+        not args.no_memory,
+        args.baseline_file,
+        args.threshold,
+        args.seed,
+    )
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,287 @@
+"""Tokenized corpora cached on disk as flat arrays of token ids.
+
+A labeled text file is tokenized once into an interned vocabulary, one flat
+array of token ids, the offsets of each document into that array, and the
+labels. The arrays are written to a binary cache file which is loaded by
+memory mapping, so reopening a corpus takes milliseconds and processes which
+open the same cache share its pages instead of copying them.
+
+The cache file is laid out as follows, with integers in native byte order:
+
+    magic          8 bytes, b"NBCORP01"
+    header         6 x uint64: n_docs, n_tokens, n_words, blob size,
+                   source size, source mtime in ns
+    offsets        (n_docs + 1) x uint64
+    word offsets   (n_words + 1) x uint64
+    tokens         n_tokens x uint32
+    labels         n_docs x int8
+    words          the UTF-8 encoded words, concatenated
+"""
+
+from __future__ import annotations
+from array import array
+import hashlib
+import mmap
+import os
+from pathlib import Path
+import struct
+
+from naive_bayes import tokenize
+from sparse import CSRMatrix, Vocabulary
+
+
+MAGIC = b"NBCORP01"
+HEADER = struct.Struct("=6Q")
+
+
+class Corpus:
+    """Labeled documents stored as flat arrays of token ids.
+
+    Attributes
+    ----------
+    offsets : array.array | memoryview
+        Offsets of each document into tokens, one more than the number of
+        documents.
+    tokens : array.array | memoryview
+        Token ids of every document, concatenated.
+    labels : array.array | memoryview
+        The label of each document.
+    words : list[str]
+        The word of each token id.
+
+    Usage
+    -----
+    >>> corpus = Corpus.build("./trainMaster.txt")
+    >>> corpus.save("./trainMaster.corpus")
+    >>> corpus = Corpus.load("./trainMaster.corpus")
+    >>> X = corpus.to_matrix()
+    """
+
+    def __init__(
+        self, offsets: array, tokens: array, labels: array, words
+    ) -> None:
+        """Create a corpus from its arrays.
+
+        Parameters
+        ----------
+        offsets : array.array | memoryview
+            Offsets of each document into tokens.
+        tokens : array.array | memoryview
+            Token ids of every document, concatenated.
+        labels : array.array | memoryview
+            The label of each document.
+        words : list[str] | Callable[[], list[str]]
+            The word of each token id, or a function returning them when they
+            are first needed.
+        """
+        self.offsets = offsets
+        self.tokens = tokens
+        self.labels = labels
+        self._words = words
+        self._vocabulary = None
+
+    @classmethod
+    def build(cls, path: str) -> Corpus:
+        """Tokenize a labeled text file.
+
+        Parameters
+        ----------
+        path : str
+            A file with one tab-separated document and label per line.
+
+        Returns
+        -------
+        Corpus
+            The tokenized documents.
+        """
+        vocabulary = Vocabulary()
+        add = vocabulary.add
+        offsets = array("Q", [0])
+        tokens = array("I")
+        labels = array("b")
+        with open(path, "r") as f:
+            for line in f:
+                text, _, label = line.rpartition("\t")
+                tokens.extend(add(w) for w in tokenize(text.replace("\t", " ")))
+                offsets.append(len(tokens))
+                labels.append(int(label))
+        corpus = cls(offsets, tokens, labels, vocabulary.words)
+        corpus._vocabulary = vocabulary
+        return corpus
+
+    @classmethod
+    def load(cls, path: str) -> Corpus:
+        """Load a corpus from a cache file by memory mapping it.
+
+        Parameters
+        ----------
+        path : str
+            Location of the cache file.
+
+        Returns
+        -------
+        Corpus
+            The corpus, whose arrays are read-only views of the file.
+
+        Raises
+        ------
+        ValueError
+            If the file is not a corpus cache.
+        """
+        with open(path, "rb") as f:
+            buf = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        if buf[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a corpus cache file.")
+        n_docs, n_tokens, n_words, n_blob, _, _ = HEADER.unpack_from(buf, len(MAGIC))
+
+        sections = []
+        start = len(MAGIC) + HEADER.size
+        layout = (
+            ("Q", n_docs + 1),
+            ("Q", n_words + 1),
+            ("I", n_tokens),
+            ("b", n_docs),
+        )
+        for fmt, n in layout:
+            end = start + struct.calcsize(fmt) * n
+            sections.append(buf[start:end].cast(fmt))
+            start = end
+        offsets, word_offsets, tokens, labels = sections
+        blob = buf[start : start + n_blob]
+
+        def words() -> list:
+            text = bytes(blob)
+            return [
+                text[s:e].decode("utf-8")
+                for s, e in zip(word_offsets, word_offsets[1:])
+            ]
+
+        return cls(offsets, tokens, labels, words)
+
+    def save(self, path: str, source: str = None) -> None:
+        """Write the corpus to a cache file.
+
+        Parameters
+        ----------
+        path : str
+            Location of the cache file.
+        source : str, optional
+            The text file the corpus was built from, whose size and
+            modification time are recorded so stale caches can be detected,
+            by default None.
+        """
+        blob = array("B")
+        word_offsets = array("Q", [0])
+        for word in self.words:
+            blob.frombytes(word.encode("utf-8"))
+            word_offsets.append(len(blob))
+        stat = os.stat(source) if source is not None else None
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(
+                HEADER.pack(
+                    len(self),
+                    len(self.tokens),
+                    len(self.words),
+                    len(blob),
+                    stat.st_size if stat else 0,
+                    stat.st_mtime_ns if stat else 0,
+                )
+            )
+            for section in (self.offsets, word_offsets, self.tokens, self.labels):
+                f.write(memoryview(section).cast("B"))
+            f.write(blob)
+        os.replace(tmp, path)
+
+    @property
+    def words(self) -> list:
+        """The word of each token id."""
+        if callable(self._words):
+            self._words = self._words()
+        return self._words
+
+    @property
+    def vocabulary(self) -> Vocabulary:
+        """The vocabulary of the corpus, whose ids are the token ids."""
+        if self._vocabulary is None:
+            self._vocabulary = Vocabulary(self.words)
+        return self._vocabulary
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def document(self, i: int):
+        """Return the token ids of the i-th document."""
+        return self.tokens[self.offsets[i] : self.offsets[i + 1]]
+
+    def to_matrix(self, rows: list = None) -> CSRMatrix:
+        """Encode documents as a matrix of counts over the corpus vocabulary.
+
+        Parameters
+        ----------
+        rows : list[int], optional
+            Documents to encode, by default None, which encodes every document.
+
+        Returns
+        -------
+        CSRMatrix
+            The encoded documents, one row per document.
+        """
+        rows = range(len(self)) if rows is None else rows
+        return CSRMatrix.from_ids((self.document(i) for i in rows), len(self.words))
+
+
+def cache_path(path: str, cache_dir: str) -> Path:
+    """Return the location of the cache file for a text file.
+
+    Parameters
+    ----------
+    path : str
+        Location of the text file.
+    cache_dir : str
+        Directory holding cache files.
+
+    Returns
+    -------
+    Path
+        Location of the cache file.
+    """
+    path = Path(path).resolve()
+    digest = hashlib.sha1(str(path).encode("utf-8")).hexdigest()[:12]
+    return Path(cache_dir) / f"{path.stem}-{digest}.corpus"
+
+
+def load_corpus(path: str, cache_dir: str) -> Corpus:
+    """Load the corpus of a labeled text file, building its cache if needed.
+
+    Parameters
+    ----------
+    path : str
+        Location of the text file.
+    cache_dir : str
+        Directory holding cache files.
+
+    Returns
+    -------
+    Corpus
+        The corpus.
+    """
+    cache_file = cache_path(path, cache_dir)
+    stat = os.stat(path)
+    try:
+        with open(cache_file, "rb") as f:
+            head = f.read(len(MAGIC) + HEADER.size)
+        if head[: len(MAGIC)] == MAGIC:
+            *_, size, mtime = HEADER.unpack_from(head, len(MAGIC))
+            if (size, mtime) == (stat.st_size, stat.st_mtime_ns):
+                return Corpus.load(cache_file)
+    except (FileNotFoundError, struct.error):
+        pass
+
+    corpus = Corpus.build(path)
+    corpus.save(cache_file, source=path)
+    return corpus
@@ -0,0 +1,187 @@
+"""Timers, counters and progress reports for the phases of a run.
+
+Phases may be nested. Time is charged to the innermost active phase only, so
+the phase times of a run add up to the time spent inside phases.
+"""
+
+from contextlib import contextmanager
+import json
+import sys
+import time
+
+
+class Recorder:
+    """Named phase timers and counters.
+
+    Attributes
+    ----------
+    timers : dict[str, float]
+        Seconds spent in each phase, excluding nested phases.
+    calls : dict[str, int]
+        Number of times each phase was entered.
+    counters : dict[str, int]
+        Value of each counter.
+
+    Usage
+    -----
+    >>> recorder = Recorder()
+    >>> with recorder.phase("fit"):
+    ...     recorder.count("systems", 2)
+    >>> recorder.summary()["counters"]
+    ... {'systems': 2}
+    """
+
+    def __init__(self) -> None:
+        """Create a recorder without any phases or counters."""
+        self.timers = {}
+        self.calls = {}
+        self.counters = {}
+        self._stack = []
+        self._last = None
+        self._start = time.perf_counter()
+
+    def _charge(self, now: float) -> None:
+        """Charge the time since the last switch to the innermost phase."""
+        if self._stack:
+            name = self._stack[-1]
+            self.timers[name] = self.timers.get(name, 0.0) + now - self._last
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a block as the given phase.
+
+        Parameters
+        ----------
+        name : str
+            Name of the phase, e.g., "load", "fit" or "write".
+        """
+        self._charge(time.perf_counter())
+        self._stack.append(name)
+        self.calls[name] = self.calls.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            self._charge(time.perf_counter())
+            self._stack.pop()
+
+    def count(self, name: str, n: int = 1) -> None:
+        """Add n to a counter."""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self) -> dict:
+        """Return the timers and counters.
+
+        Returns
+        -------
+        dict[str, Any]
+            The total seconds since the recorder was created or reset, and the
+            seconds and calls of each phase and the value of each counter.
+        """
+        return {
+            "seconds": time.perf_counter() - self._start,
+            "phases": {
+                name: {"seconds": seconds, "calls": self.calls[name]}
+                for name, seconds in self.timers.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def write(self, path: str, **extra) -> None:
+        """Write the summary and any extra values to a JSON file."""
+        with open(path, "w") as f:
+            json.dump({**extra, **self.summary()}, f, indent=2)
+
+    def reset(self) -> None:
+        """Forget every phase and counter."""
+        self.__init__()
+
+
+# The recorder of this process
+recorder = Recorder()
+
+
+class Progress:
+    """Report the progress, throughput and remaining time of a loop.
+
+    Attributes
+    ----------
+    total : int
+        Number of items to process.
+    done : int
+        Number of items processed.
+    every : int
+        Number of items between reports.
+    unit : str
+        Name of the items, used in reports.
+
+    Usage
+    -----
+    >>> progress = Progress(1770, every=10, unit="pairs")
+    >>> for pair in pairs:
+    ...     progress.update()
+    ... 10 / 1770 = 0.565% | 52.1 pairs/s | ETA 0:00:33
+    """
+
+    def __init__(
+        self,
+        total: int,
+        done: int = 0,
+        every: int = 10,
+        unit: str = "items",
+        stream=None,
+    ) -> None:
+        """Start reporting.
+
+        Parameters
+        ----------
+        total : int
+            Number of items to process.
+        done : int, optional
+            Number of items already processed, e.g., by an earlier run, by
+            default 0. They count towards the progress but not the throughput.
+        every : int, optional
+            Number of items between reports, by default 10.
+        unit : str, optional
+            Name of the items, by default "items".
+        stream : TextIO, optional
+            Where to write reports, by default None, which is sys.stdout.
+        """
+        self.total = total
+        self.done = done
+        self.every = every
+        self.unit = unit
+        self._stream = stream
+        self._first = done
+        self._start = time.perf_counter()
+
+    def update(self, n: int = 1) -> None:
+        """Record n processed items, reporting every every items."""
+        before = self.done
+        self.done += n
+        if self.every > 0 and (
+            self.done // self.every > before // self.every or self.done == self.total
+        ):
+            self.report()
+
+    def report(self) -> None:
+        """Write the progress, throughput and estimated remaining time."""
+        elapsed = time.perf_counter() - self._start
+        rate = (self.done - self._first) / elapsed if elapsed > 0 else 0.0
+        if rate > 0:
+            eta = format_seconds((self.total - self.done) / rate)
+        else:
+            eta = "?"
+        percent = round(100 * self.done / self.total, 3) if self.total else 100.0
+        print(
+            f"{self.done} / {self.total} = {percent}% | "
+            f"{rate:.1f} {self.unit}/s | ETA {eta}",
+            file=self._stream or sys.stdout,
+        )
+
+
+def format_seconds(seconds: float) -> str:
+    """Format a number of seconds as hours:minutes:seconds."""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
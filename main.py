@@ -14,17 +14,71 @@ import sys
 sys.path.insert(0, "/home/hpc/kurlanl1/courses/CSC-427/project4/NLP-Project-4")
 
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import cProfile
+from functools import lru_cache
+from itertools import combinations
+import json
+from multiprocessing.shared_memory import SharedMemory
 from pathlib import Path
 
-from metrics import fscore
-from naive_bayes import NaiveBayesClassifier
-from split import n_docs_per_size, sizes
-from utils import choices
+from corpus import Corpus, load_corpus
+from instrument import Progress, recorder
+from metrics import fscore, fscores
+from naive_bayes import NaiveBayesClassifier, TokenCache, tokenize
+from significance import adaptive_pvalues, fscore_table, pairwise_pvalues, settled
+from sparse import CSRMatrix, Vocabulary
+from split import (
+    load_splits,
+    n_docs_per_size,
+    sizes,
+    splits_file,
+    training_sets_path,
+)
+from utils import ResultWriter, Sampler, batched, get_rng
 
 
 b = 1000
 
 
+def iter_x_y(path: str):
+    """Read an input file line by line, yielding each document and its label.
+
+    Parameters
+    ----------
+    path : str
+        Input file to read.
+
+    Yields
+    ------
+    tuple[str, int]
+        The text of a document and its label.
+    """
+    with open(path, "r") as f:
+        for line in f:
+            text, _, label = line.rpartition("\t")
+            yield text.replace("\t", " "), int(label)
+
+
+def iter_x(path: str):
+    """Read an unlabeled input file line by line, yielding each document.
+
+    Parameters
+    ----------
+    path : str
+        Input file to read, with one document per line.
+
+    Yields
+    ------
+    str
+        The text of a document.
+    """
+    with open(path, "r") as f:
+        for line in f:
+            yield line.rstrip("\n")
+
+
 def get_x_y(path: str) -> tuple:
     """Read an input file and return the document's text along with its label.
 
@@ -38,123 +92,1050 @@ def get_x_y(path: str) -> tuple:
     tuple[list[str], list[int]]
         Corresponding arrays of documents and labels.
     """
-    with open(path, "r") as f:
-        lines = f.readlines()
-    y = [int(l.split("\t")[-1]) for l in lines]
-    x = [" ".join(l.split("\t")[0:-1]) for l in lines]
+    x, y = [], []
+    with recorder.phase("load"):
+        for x_i, y_i in iter_x_y(path):
+            x.append(x_i)
+            y.append(y_i)
+    recorder.count("docs_loaded", len(x))
 
     return x, y
 
 
-def learn() -> list:
+@lru_cache(maxsize=1)
+def _token_cache() -> TokenCache:
+    """Return the token cache shared by the classifiers fitted in this process."""
+    return TokenCache()
+
+
+def _sanitize(x: list) -> None:
+    """Tokenize documents into the shared token cache, timed as sanitize.
+
+    The classifiers then take the tokens of these documents from the cache, so
+    that fit and predict are timed without tokenization as long as the cache
+    holds all of them.
+
+    Parameters
+    ----------
+    x : list[str]
+        The documents.
+    """
+    cache = _token_cache()
+    with recorder.phase("sanitize"):
+        for x_i in x:
+            # Also derives the tokens, which the count systems use
+            cache.unique(x_i)
+
+
+@lru_cache(maxsize=1)
+def _training_data(train_file: str, cache_dir: str) -> tuple:
+    """Load the training set and its subsets once per process.
+
+    Parameters
+    ----------
+    train_file : str
+        Location of the training set the subsets were drawn from.
+    cache_dir : str
+        Directory of tokenized corpus caches, or None.
+
+    Returns
+    -------
+    tuple[Corpus, CSRMatrix, list[tuple[array.array, array.array]]]
+        The training set, its document-term counts and the subsets.
+
+    Raises
+    ------
+    ValueError
+        If the subsets were drawn from a training set of a different size.
+    """
+    if cache_dir is None:
+        with recorder.phase("sanitize"):
+            corpus = Corpus.build(train_file)
+    else:
+        with recorder.phase("load"):
+            corpus = load_corpus(train_file, cache_dir)
+    recorder.count("docs_loaded", len(corpus))
+    n_rows, splits = load_splits(splits_file)
+    if n_rows != len(corpus):
+        raise ValueError(
+            f"The subsets were drawn from {n_rows} documents, but "
+            f"{train_file} has {len(corpus)}."
+        )
+    return corpus, corpus.to_matrix(), splits
+
+
+def _fit_split(task: tuple) -> tuple:
+    """Fit the count and binary classifiers of one subset in splits.bin.
+
+    Parameters
+    ----------
+    task : tuple[str, str, int]
+        The training set, the corpus cache directory and the subset index.
+
+    Returns
+    -------
+    tuple[NaiveBayesClassifier, NaiveBayesClassifier]
+        The count and binary classifiers.
+    """
+    train_file, cache_dir, k = task
+    corpus, X, splits = _training_data(train_file, cache_dir)
+    rows, counts = splits[k]
+    weights = [0] * len(corpus)
+    for r, c in zip(rows, counts):
+        weights[r] = c
+
+    with recorder.phase("fit"):
+        clf_count = NaiveBayesClassifier(cache=_token_cache())
+        clf_count.fit_matrix(X, corpus.labels, corpus.vocabulary, weights)
+        clf_binary = NaiveBayesClassifier(binary=True, cache=_token_cache())
+        clf_binary.fit_matrix(X, corpus.labels, corpus.vocabulary, weights)
+
+    return clf_count, clf_binary
+
+
+def _fit_file(task: tuple) -> tuple:
+    """Fit the count and binary classifiers of one subset text file.
+
+    Parameters
+    ----------
+    task : tuple[str, str]
+        The subset text file and the corpus cache directory.
+
+    Returns
+    -------
+    tuple[NaiveBayesClassifier, NaiveBayesClassifier]
+        The count and binary classifiers.
+    """
+    path, cache_dir = task
+    clf_count = NaiveBayesClassifier(cache=_token_cache())
+    clf_binary = NaiveBayesClassifier(binary=True, cache=_token_cache())
+
+    if cache_dir is None:
+        x_train, y_train = get_x_y(path)
+        _sanitize(x_train)
+        with recorder.phase("fit"):
+            clf_count.fit(x_train, y_train)
+            clf_binary.fit(x_train, y_train)
+    else:
+        with recorder.phase("load"):
+            corpus = load_corpus(path, cache_dir)
+        with recorder.phase("fit"):
+            X = corpus.to_matrix()
+            clf_count.fit_matrix(X, corpus.labels, corpus.vocabulary)
+            clf_binary.fit_matrix(X, corpus.labels, corpus.vocabulary)
+
+    return clf_count, clf_binary
+
+
+def _sources(paths: list) -> list:
+    """Return the path, size and modification time in ns of each file.
+
+    Parameters
+    ----------
+    paths : list[str | Path]
+        Files the classifiers are learned from.
+
+    Returns
+    -------
+    list[list]
+        One [path, size, mtime] list per file, as stored in sources.json.
+    """
+    sources = []
+    for path in paths:
+        stat = Path(path).stat()
+        sources.append([str(path), stat.st_size, stat.st_mtime_ns])
+    return sources
+
+
+def learn(
+    train_file: str, cache_dir: str = None, jobs: int = 1, model_dir: str = None
+) -> list:
     """Learn the sixty classifiers.
 
+    When split.py wrote trainingSets/splits.bin, every subset is fitted from
+    one tokenization of the training set by weighting its documents with how
+    many times the subset selected them. Otherwise the subsets are read from
+    the text files trainingSets/<size>/train<i>.txt.
+
+    With a model directory, the classifiers are loaded from it if it holds all
+    of them and the files they were learned from have not changed since, and
+    saved to it after they are learned otherwise. Its sources.json records the
+    size and modification time of splits.bin and the training set, or of the
+    subset text files.
+
+    Parameters
+    ----------
+    train_file : str
+        Location of the training set the subsets were drawn from.
+    cache_dir : str, optional
+        Directory of tokenized corpus caches, by default None, which reads and
+        tokenizes the training sets from text.
+    jobs : int, optional
+        Number of worker processes fitting subsets in parallel, by default 1,
+        which fits them in this process. Each worker loads the training set
+        once and sends back only the counts of its classifiers.
+    model_dir : str, optional
+        Directory of saved classifiers, by default None, which always learns
+        them.
+
     Returns
     -------
     list[NaiveBayesClassifier]
-        A list of learned classifiers.
+        A list of learned classifiers, in the same order for any number of
+        jobs. They share one token cache, so every distinct document is
+        tokenized once across all of them.
+
+    Raises
+    ------
+    ValueError
+        If the subsets were drawn from a training set of a different size.
     """
-    systems = []
-    for size in sizes:
-        for i in range(1, n_docs_per_size + 1):
-            path = Path("./trainingSets") / str(size) / f"train{i}.txt"
-            x_train, y_train = get_x_y(path)
+    if splits_file.exists():
+        _, splits = load_splits(splits_file)
+        fit = _fit_split
+        tasks = [(train_file, cache_dir, k) for k in range(len(splits))]
+    else:
+        fit = _fit_file
+        tasks = [
+            (training_sets_path / str(size) / f"train{i}.txt", cache_dir)
+            for size in sizes
+            for i in range(1, n_docs_per_size + 1)
+        ]
 
-            clf_count = NaiveBayesClassifier()
-            clf_count.fit(x_train, y_train)
-            systems.append(clf_count)
+    cache = _token_cache()
+    if model_dir is not None:
+        paths = [Path(model_dir) / f"system{k}.nbm" for k in range(2 * len(tasks))]
+        sources_path = Path(model_dir) / "sources.json"
+        if fit is _fit_split:
+            sources = _sources([splits_file, train_file])
+        else:
+            sources = _sources([path for path, _ in tasks])
+        if (
+            all(path.exists() for path in paths)
+            and sources_path.exists()
+            and json.loads(sources_path.read_text()) == sources
+        ):
+            with recorder.phase("load"):
+                return [NaiveBayesClassifier.load(path, cache=cache) for path in paths]
 
-            clf_binary = NaiveBayesClassifier(binary=True)
-            clf_binary.fit(x_train, y_train)
-            systems.append(clf_binary)
+    # Worker processes keep their own timers, so their time is charged to fit
+    with recorder.phase("fit"):
+        if jobs == 1:
+            results = list(map(fit, tasks))
+        else:
+            with ProcessPoolExecutor(jobs) as executor:
+                results = list(executor.map(fit, tasks))
+    recorder.count("systems", 2 * len(results))
+
+    systems = []
+    for clf_count, clf_binary in results:
+        clf_count.cache = clf_binary.cache = cache
+        systems.append(clf_count)
+        systems.append(clf_binary)
+
+    if model_dir is not None:
+        with recorder.phase("write"):
+            for clf, path in zip(systems, paths):
+                clf.save(path)
+            # Written last, so that an interrupted save is learned again
+            sources_path.write_text(json.dumps(sources))
 
     return systems
 
 
-def bootstrap(test_file: str, systems: list) -> None:
+def predict_systems(systems: list, x: list) -> list:
+    """Score every system on the documents exactly once.
+
+    Parameters
+    ----------
+    systems : list[NaiveBayesClassifier]
+        List of fitted systems.
+    x : list[str] | Corpus
+        A list of textual documents, or a tokenized corpus.
+
+    Returns
+    -------
+    list[bytearray]
+        A systems by documents matrix of predictions, one compact row of 0/1
+        values per system.
+    """
+    if isinstance(x, Corpus):
+        with recorder.phase("predict"):
+            X = x.to_matrix()
+            return [bytearray(clf.predict_matrix(X, x.vocabulary)) for clf in systems]
+
+    _sanitize(x)
+    with recorder.phase("predict"):
+        return [bytearray(clf.predict(x)) for clf in systems]
+
+
+# Data read by the pairwise bootstrap, set up once per process
+_bootstrap_state = {}
+
+
+def _init_bootstrap_worker(name: str, n_systems: int, n: int) -> None:
+    """Attach a worker process to the shared predictions and labels.
+
+    Parameters
+    ----------
+    name : str
+        Name of the shared memory block.
+    n_systems : int
+        Number of systems, i.e., rows of predictions.
+    n : int
+        Number of test documents.
+    """
+    shm = SharedMemory(name)
+    buf = shm.buf
+    _bootstrap_state["shm"] = shm
+    _bootstrap_state["predictions"] = [
+        buf[k * n : (k + 1) * n] for k in range(n_systems)
+    ]
+    _bootstrap_state["labels"] = buf[n_systems * n : (n_systems + 1) * n]
+
+
+def _bootstrap_pair(task: tuple) -> tuple:
+    """Compare two systems with the paired bootstrap test.
+
+    Parameters
+    ----------
+    task : tuple[int, int, str, tuple[float, int] | None]
+        The indices of the two systems, the seed of their resamples and, for
+        adaptive stopping, the significance level and the number of resamples
+        drawn between checks.
+
+    Returns
+    -------
+    tuple[float, float, int]
+        The pvalue, the effect size and the number of resamples used.
+    """
+    i, j, seed, adaptive = task
+    alpha, block = adaptive if adaptive is not None else (None, b)
+    preds_a = _bootstrap_state["predictions"][i]
+    preds_b = _bootstrap_state["predictions"][j]
+    y_test = _bootstrap_state["labels"]
+
+    f_a, f_b = fscores([preds_a, preds_b], y_test)
+    delta_f = abs(f_a - f_b)
+
+    n = len(preds_a)
+    sampler = Sampler.uniform(n, seed)
+    s = 0
+    m = 0
+    while m < b:
+        for _ in range(min(block, b - m)):
+            with recorder.phase("resample"):
+                idx = sampler.sample(n)
+                preds_a_ = [preds_a[i] for i in idx]
+                preds_b_ = [preds_b[i] for i in idx]
+                y_test_ = [y_test[i] for i in idx]
+
+            with recorder.phase("metric"):
+                f_a_, f_b_ = fscores([preds_a_, preds_b_], y_test_)
+            delta_f_ = f_a_ - f_b_
+
+            s = s + 1 if delta_f_ >= 2 * abs(delta_f) else s
+            m += 1
+
+        if alpha is not None and settled(s, m, alpha):
+            break
+
+    pval = s / m
+
+    return pval, delta_f, m
+
+
+def _bootstrap_pairs(predictions: list, labels: list, tasks: list, jobs: int):
+    """Run the paired bootstrap test for every task, in order.
+
+    Parameters
+    ----------
+    predictions : list[bytearray]
+        A systems by documents matrix of predictions.
+    labels : list[int]
+        Ground truth labels for the documents.
+    tasks : list[tuple[int, int, str, tuple[float, int] | None]]
+        The pairs of systems to compare, see _bootstrap_pair.
+    jobs : int
+        Number of worker processes. With more than one, the predictions and
+        labels are placed in shared memory which every worker attaches to.
+
+    Yields
+    ------
+    tuple[float, float, int]
+        The pvalue, the effect size and the number of resamples of each task.
+    """
+    if jobs == 1:
+        _bootstrap_state["predictions"] = predictions
+        _bootstrap_state["labels"] = labels
+        yield from map(_bootstrap_pair, tasks)
+        return
+
+    n_systems, n = len(predictions), len(labels)
+    shm = SharedMemory(create=True, size=max(1, (n_systems + 1) * n))
+    try:
+        for k, row in enumerate(predictions):
+            shm.buf[k * n : (k + 1) * n] = row
+        shm.buf[n_systems * n : (n_systems + 1) * n] = bytes(labels)
+
+        with ProcessPoolExecutor(
+            jobs,
+            initializer=_init_bootstrap_worker,
+            initargs=(shm.name, n_systems, n),
+        ) as executor:
+            chunksize = max(1, len(tasks) // (8 * jobs))
+            yield from executor.map(_bootstrap_pair, tasks, chunksize=chunksize)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def bootstrap(
+    test_file: str,
+    systems: list,
+    seed=None,
+    cache_dir: str = None,
+    jobs: int = 1,
+    resume: bool = False,
+    method: str = "paired",
+    alpha: float = None,
+    block: int = 50,
+    progress_every: int = 10,
+) -> None:
     """Perform bootstraping on the test set and create the results file.
 
+    With the paired method, every pair of systems resamples the test set from
+    its own seed, which is derived from seed and the indices of the two
+    systems. The results file is therefore the same for any number of jobs.
+    With the shared method, every system is scored on the same resamples and
+    all pairs are compared from one table of fscores, see significance.py.
+    Rows are written in batches and record the indices of their systems, so
+    that an interrupted run can be resumed.
+
+    Each pair is resampled b times, unless alpha is given. Then resamples are
+    drawn in blocks and a pair stops as soon as the confidence interval of its
+    running pvalue excludes alpha, while pairs near alpha continue up to b
+    resamples. Every row records how many resamples its pair used.
+
     Parameters
     ----------
     test_file : str
         Location of a test file.
     systems : list[NaiveBayesClassifier]
         List of systems to perform bootstraping on.
+    seed : int | random.Random | None, optional
+        Seed for the resampling, by default None.
+    cache_dir : str, optional
+        Directory of tokenized corpus caches, by default None, which reads and
+        tokenizes the test set from text.
+    jobs : int, optional
+        Number of worker processes comparing pairs in parallel, by default 1.
+    resume : bool, optional
+        If true, keep the pairs already in the results file and only compare
+        the remaining ones, by default False.
+    method : str, optional
+        Either "paired" or "shared", by default "paired".
+    alpha : float, optional
+        Significance level for adaptive stopping, by default None, which
+        always draws b resamples.
+    block : int, optional
+        Number of resamples drawn between adaptive stopping checks, by
+        default 50.
+    progress_every : int, optional
+        Number of pairs between progress reports, by default 10. Zero turns
+        them off.
+
+    Raises
+    ------
+    ValueError
+        If method is not "paired" or "shared".
     """
-    with open(f"./output{b}.csv", "w") as f:
-        f.write("pval,effect_size,typeA,typeB\n")
-    x_test, y_test = get_x_y(test_file)
-    track = 0
-    pairs = set()
-    for i, clf_a in enumerate(systems):
-        for j, clf_b in enumerate(systems):
-            if clf_a is clf_b or (i, j) in pairs or (j, i) in pairs:
-                continue
-
-            pairs.add((i, j))
-            track += 1
-            if track % 10 == 0:
-                print(f"{track} / {1770} = {round(100 * track / 1770, 3)}%")
-
-            preds_a = clf_a.predict(x_test)
-            preds_b = clf_b.predict(x_test)
-
-            f_a = fscore(preds_a, y_test)
-            f_b = fscore(preds_b, y_test)
-            delta_f = abs(f_a - f_b)
-
-            n = len(preds_a)
-            s = 0
-            for _ in range(b):
-                idx = choices(list(range(n)), [1 for _ in range(n)], n)
-                preds_a_ = [preds_a[i] for i in idx]
-                preds_b_ = [preds_b[i] for i in idx]
-                y_test_ = [y_test[i] for i in idx]
+    if method not in {"paired", "shared"}:
+        raise ValueError(f"method must be paired or shared, but got {method}.")
+
+    writer = ResultWriter(
+        f"./output{b}.csv",
+        [
+            "pval",
+            "effect_size",
+            "typeA",
+            "typeB",
+            "systemA",
+            "systemB",
+            "n_resamples",
+        ],
+        ["systemA", "systemB"],
+        resume,
+    )
+    if cache_dir is None:
+        x_test, y_test = get_x_y(test_file)
+    else:
+        with recorder.phase("load"):
+            x_test = load_corpus(test_file, cache_dir)
+            y_test = list(x_test.labels)
+    predictions = predict_systems(systems, x_test)
+
+    base_seed = get_rng(seed).getrandbits(64)
+    n_pairs = len(systems) * (len(systems) - 1) // 2
+    pairs = [
+        (i, j)
+        for i, j in combinations(range(len(systems)), 2)
+        if not writer.is_done(i, j)
+    ]
+    # With worker processes, or the shared method, resampling and scoring are
+    # not timed separately
+    progress = Progress(n_pairs, n_pairs - len(pairs), progress_every, "pairs")
+    with recorder.phase("resample"):
+        if method == "shared" and alpha is not None:
+            results = adaptive_pvalues(
+                predictions, y_test, pairs, b, alpha, block, base_seed
+            )
+        elif method == "shared":
+            full, table = fscore_table(predictions, y_test, b, base_seed)
+            results = [(p, d, b) for p, d in pairwise_pvalues(full, table, pairs)]
+        else:
+            adaptive = None if alpha is None else (alpha, block)
+            tasks = [(i, j, f"{base_seed}-{i}-{j}", adaptive) for i, j in pairs]
+            results = _bootstrap_pairs(predictions, y_test, tasks, jobs)
+
+        with writer:
+            for (i, j), (pval, delta_f, n_resamples) in zip(pairs, results):
+                with recorder.phase("write"):
+                    writer.write(
+                        [
+                            pval,
+                            delta_f,
+                            "b" if systems[i].binary else "c",
+                            "b" if systems[j].binary else "c",
+                            i,
+                            j,
+                            n_resamples,
+                        ]
+                    )
+                recorder.count("pairs")
+                recorder.count("resamples", n_resamples)
+                progress.update()
+
+            with recorder.phase("write"):
+                writer.flush()
 
-                f_a_ = fscore(preds_a_, y_test_)
-                f_b_ = fscore(preds_b_, y_test_)
-                delta_f_ = f_a_ - f_b_
 
-                s = s + 1 if delta_f_ >= 2 * abs(delta_f) else s
+def score(
+    train_file: str,
+    input_file: str,
+    output_file: str,
+    binary: bool = False,
+    labeled: bool = True,
+    chunk_size: int = 1000,
+    model_file: str = None,
+) -> None:
+    """Fit or load a classifier and score a file line by line.
 
-            pval = s / b
+    The input is read, scored and written chunk_size documents at a time, so
+    memory does not grow with its size and results appear as soon as the
+    first chunk is scored.
 
-            with open(f"./output{b}.csv", "a") as f:
-                line = ",".join(
-                    [
-                        str(pval),
-                        str(delta_f),
-                        "b" if clf_a.binary else "c",
-                        "b" if clf_b.binary else "c",
-                    ]
+    Parameters
+    ----------
+    train_file : str
+        Path to the training set.
+    input_file : str
+        Path to a file with one document per line.
+    output_file : str
+        Path to the output file, which receives the predicted label and the
+        log odds of the positive class of each document, separated by a tab.
+        With other than two classes, the label is followed by the joint log
+        likelihood of the document and each class, in the order of classes.
+    binary : bool, optional
+        If true, fit a binary classifier, by default False. A loaded classifier
+        keeps its own mode.
+    labeled : bool, optional
+        If true, the last tab-separated field of each input line is a label,
+        which is ignored, by default True.
+    chunk_size : int, optional
+        Number of documents scored at once, by default 1000.
+    model_file : str, optional
+        Location of a saved classifier, which is loaded if it exists and
+        otherwise fitted on the training set and saved there, by default None,
+        which always fits the classifier.
+    """
+    if model_file is not None and Path(model_file).exists():
+        clf = NaiveBayesClassifier.load(model_file)
+    else:
+        clf = NaiveBayesClassifier(binary=binary)
+        clf.fit(*get_x_y(train_file))
+        if model_file is not None:
+            clf.save(model_file)
+
+    if labeled:
+        x = (x_i for x_i, _ in iter_x_y(input_file))
+    else:
+        x = iter_x(input_file)
+
+    with open(output_file, "w") as f:
+        for chunk in batched(clf.decision_function_iter(x, chunk_size), chunk_size):
+            labels = clf._labels(chunk)
+            if len(clf.classes) == 2:
+                f.writelines(f"{label}\t{d}\n" for label, d in zip(labels, chunk))
+            else:
+                f.writelines(
+                    "\t".join(map(str, [label, *s])) + "\n"
+                    for label, s in zip(labels, chunk)
                 )
-                f.write(line + "\n")
 
 
-def main(test_file: str) -> None:
+def tune(
+    x_train: list,
+    y_train: list,
+    x_val: list,
+    y_val: list,
+    deltas: list,
+    modes: list = (False, True),
+) -> tuple:
+    """Find the delta and mode of the classifier with the best F-score.
+
+    The training documents are tokenized and counted once for each mode, and
+    every delta is scored from those counts by predict_grid, so no classifier
+    is fitted again for a delta.
+
+    Parameters
+    ----------
+    x_train : list[str]
+        The training documents.
+    y_train : list[int]
+        The training labels.
+    x_val : list[str]
+        The validation documents.
+    y_val : list[int]
+        The validation labels.
+    deltas : list[float]
+        Positive values of the smoothing parameter to try.
+    modes : list[bool], optional
+        The modes to try, false for counts and true for binary features, by
+        default both.
+
+    Returns
+    -------
+    tuple[list[tuple[bool, float, float]], NaiveBayesClassifier]
+        The mode, delta and F-score on the validation set of every
+        configuration, and the classifier of the best one.
+    """
+    with recorder.phase("sanitize"):
+        tokens = [tokenize(x_i) for x_i in x_train]
+        vocabulary = Vocabulary.fit(tokens)
+        X = CSRMatrix.from_documents(tokens, vocabulary)
+
+    results = []
+    best = None
+    for binary in modes:
+        clf = NaiveBayesClassifier(binary=binary)
+        with recorder.phase("fit"):
+            clf.fit_matrix(X, y_train, vocabulary)
+        with recorder.phase("predict"):
+            predictions = clf.predict_grid(x_val, deltas)
+        with recorder.phase("metric"):
+            scores = fscores(predictions, y_val)
+        for delta, f in zip(deltas, scores):
+            results.append((binary, delta, f))
+            if best is None or f > best[0]:
+                best = (f, delta, clf)
+
+    _, delta, clf = best
+    clf.delta = delta
+    return results, clf
+
+
+def shrink(
+    clf: NaiveBayesClassifier,
+    x_val: list,
+    y_val: list,
+    sizes: list,
+    selection: str = "mi",
+    tolerance: float = 0.01,
+) -> tuple:
+    """Find the smallest vocabulary which keeps the F-score of a classifier.
+
+    Parameters
+    ----------
+    clf : NaiveBayesClassifier
+        A fitted classifier, which is left unchanged.
+    x_val : list[str]
+        The validation documents.
+    y_val : list[int]
+        The validation labels.
+    sizes : list[int]
+        Numbers of features to try.
+    selection : str, optional
+        How to rank the features, by default "mi", see NaiveBayesClassifier.
+    tolerance : float, optional
+        Largest allowed drop of the F-score on the validation set, by default
+        0.01.
+
+    Returns
+    -------
+    tuple[list[tuple[int, float]], NaiveBayesClassifier]
+        The number of features and F-score of every size tried, and the
+        smallest classifier within the tolerance, which is clf itself if
+        there is none.
+    """
+    full = fscore(clf.predict(x_val), y_val)
+    results = []
+    for size in sorted(sizes):
+        # The copy owns all of its counts, so neither pruning nor updating it
+        # changes clf. Copies share the token cache, which is not copied.
+        pruned = copy.deepcopy(clf)
+        pruned.cache = clf.cache
+        pruned.prune(size, selection)
+        f = fscore(pruned.predict(x_val), y_val)
+        results.append((len(pruned.vocabulary), f))
+        if f >= full - tolerance:
+            return results, pruned
+    return results, clf
+
+
+def sweep(
+    train_file: str,
+    validation_file: str,
+    output_file: str,
+    deltas: list,
+    model_file: str = None,
+    sizes: list = None,
+    selection: str = "mi",
+    tolerance: float = 0.01,
+) -> None:
+    """Score a grid of deltas in both modes and keep the best classifier.
+
+    Parameters
+    ----------
+    train_file : str
+        Path to the training set.
+    validation_file : str
+        Path to the validation set.
+    output_file : str
+        Path to the output file, which receives the mode, delta and F-score of
+        every configuration.
+    deltas : list[float]
+        Positive values of the smoothing parameter to try.
+    model_file : str, optional
+        Location in which to save the best classifier, by default None.
+    sizes : list[int], optional
+        If given, the best classifier is pruned to the smallest of these
+        numbers of features which keeps its F-score within tolerance, by
+        default None.
+    selection : str, optional
+        How to rank the features for pruning, by default "mi".
+    tolerance : float, optional
+        Largest allowed drop of the F-score by pruning, by default 0.01.
+    """
+    with recorder.phase("load"):
+        x_train, y_train = get_x_y(train_file)
+        x_val, y_val = get_x_y(validation_file)
+    results, clf = tune(x_train, y_train, x_val, y_val, deltas)
+
+    header = ["type", "delta", "fscore"]
+    with ResultWriter(output_file, header, ["type", "delta"]) as writer:
+        for binary, delta, f in results:
+            writer.write(["b" if binary else "c", delta, f])
+    print(
+        f"Best: {'binary' if clf.binary else 'count'} features with "
+        f"delta={clf.delta}, fscore={max(f for *_, f in results)}"
+    )
+    if sizes:
+        pruned, clf = shrink(clf, x_val, y_val, sizes, selection, tolerance)
+        for size, f in pruned:
+            print(f"{size} features: fscore={f}")
+        print(f"Kept {len(clf.vocabulary)} features.")
+    if model_file is not None:
+        clf.save(model_file)
+
+
+def main(
+    train_file: str,
+    test_file: str,
+    seed: int = None,
+    cache_dir: str = None,
+    jobs: int = 1,
+    resume: bool = False,
+    method: str = "paired",
+    alpha: float = None,
+    model_dir: str = None,
+    progress_every: int = 10,
+    profile_file: str = None,
+    summary_file: str = None,
+) -> None:
     """Produce the deliverables.
 
+    The time spent in each phase (load, sanitize, fit, predict, resample,
+    metric and write) is recorded and written to a JSON summary at the end.
+
     Parameters
     ----------
-    training_sets_path : str
-        Path to the training sets directory.
+    train_file : str
+        Path to the training set the subsets were drawn from.
     test_file : str
         Path to the test file.
+    seed : int, optional
+        Seed for the bootstrap resampling, by default None.
+    cache_dir : str, optional
+        Directory of tokenized corpus caches, by default None.
+    jobs : int, optional
+        Number of worker processes, by default 1.
+    resume : bool, optional
+        If true, resume the bootstrap from an existing results file, by
+        default False.
+    method : str, optional
+        Either "paired" or "shared", by default "paired".
+    alpha : float, optional
+        Significance level for adaptive stopping, by default None.
+    model_dir : str, optional
+        Directory of saved classifiers, by default None.
+    progress_every : int, optional
+        Number of pairs of systems between progress reports, by default 10.
+    profile_file : str, optional
+        Location to which to write cProfile statistics of the run, by default
+        None, which does not profile it.
+    summary_file : str, optional
+        Location of the JSON summary of the run, by default None, which does
+        not write one.
     """
-    systems = learn()
-    bootstrap(test_file, systems)
+    profiler = cProfile.Profile() if profile_file is not None else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        systems = learn(train_file, cache_dir, jobs, model_dir)
+        bootstrap(
+            test_file,
+            systems,
+            seed,
+            cache_dir,
+            jobs,
+            resume,
+            method,
+            alpha,
+            progress_every=progress_every,
+        )
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+
+    if summary_file is not None:
+        recorder.write(summary_file, jobs=jobs, method=method, resamples=b)
 
 
 if __name__ == "__main__":
     parser = ArgumentParser()
 
+    parser.add_argument(
+        "--train-file",
+        action="store",
+        default="./trainMaster.txt",
+        help="Unix-style path to the trainMaster.txt file.",
+    )
     parser.add_argument(
         "--test-file",
         action="store",
         default="./testMaster.txt",
         help="Unix-style path to the testMaster.txt file.",
     )
+    parser.add_argument(
+        "--seed",
+        action="store",
+        type=int,
+        default=None,
+        help="Seed for the bootstrap resampling.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        action="store",
+        default=None,
+        help="Directory in which to cache tokenized corpora between runs.",
+    )
+    parser.add_argument(
+        "--jobs",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of worker processes.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the pairs of systems already in the results file.",
+    )
+    parser.add_argument(
+        "--method",
+        action="store",
+        choices=("paired", "shared"),
+        default="paired",
+        help="Resample each pair of systems separately, or all systems at once.",
+    )
+    parser.add_argument(
+        "--adaptive-alpha",
+        action="store",
+        type=float,
+        default=None,
+        help="Stop resampling a pair once its pvalue is clearly above or below "
+        "this significance level.",
+    )
+    parser.add_argument(
+        "--model-dir",
+        action="store",
+        default=None,
+        help="Directory from which to load the classifiers, or in which to save "
+        "them after learning.",
+    )
+    parser.add_argument(
+        "--progress-every",
+        action="store",
+        type=int,
+        default=10,
+        help="Number of pairs of systems between progress reports.",
+    )
+    parser.add_argument(
+        "--profile-file",
+        action="store",
+        default=None,
+        help="Unix-style path to which to write cProfile statistics of the run.",
+    )
+    parser.add_argument(
+        "--summary-file",
+        action="store",
+        default="./summary.json",
+        help="Unix-style path to the JSON summary of the time spent in each phase.",
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    score_parser = subparsers.add_parser(
+        "score",
+        help="Fit one classifier on the train file and stream predictions for "
+        "a file.",
+    )
+    score_parser.add_argument(
+        "--input-file",
+        action="store",
+        required=True,
+        help="Unix-style path to a file with one document per line.",
+    )
+    score_parser.add_argument(
+        "--output-file",
+        action="store",
+        required=True,
+        help="Unix-style path to the file of predicted labels and scores.",
+    )
+    score_parser.add_argument(
+        "--binary",
+        action="store_true",
+        help="Only consider binary features.",
+    )
+    score_parser.add_argument(
+        "--unlabeled",
+        action="store_true",
+        help="The input lines have no label field.",
+    )
+    score_parser.add_argument(
+        "--model-file",
+        action="store",
+        default=None,
+        help="Unix-style path from which to load the classifier, or in which to "
+        "save it after fitting.",
+    )
+    score_parser.add_argument(
+        "--chunk-size",
+        action="store",
+        type=int,
+        default=1000,
+        help="Number of documents scored at once.",
+    )
+
+    sweep_parser = subparsers.add_parser(
+        "sweep",
+        help="Score a grid of deltas in both modes on a validation file without "
+        "fitting a classifier for each.",
+    )
+    sweep_parser.add_argument(
+        "--validation-file",
+        action="store",
+        required=True,
+        help="Unix-style path to the labeled validation file.",
+    )
+    sweep_parser.add_argument(
+        "--deltas",
+        action="store",
+        default="0.01,0.05,0.1,0.25,0.5,1,2,5",
+        help="Comma-separated values of the smoothing parameter.",
+    )
+    sweep_parser.add_argument(
+        "--output-file",
+        action="store",
+        default="./sweep.csv",
+        help="Unix-style path to the F-score of every configuration.",
+    )
+    sweep_parser.add_argument(
+        "--model-file",
+        action="store",
+        default=None,
+        help="Unix-style path in which to save the best classifier.",
+    )
+    sweep_parser.add_argument(
+        "--max-features",
+        action="store",
+        default=None,
+        help="Comma-separated numbers of features to prune the best classifier "
+        "to. The smallest which keeps its F-score within --tolerance is kept.",
+    )
+    sweep_parser.add_argument(
+        "--selection",
+        action="store",
+        choices=["count", "log_odds", "mi", "chi2"],
+        default="mi",
+        help="How to rank the features for pruning.",
+    )
+    sweep_parser.add_argument(
+        "--tolerance",
+        action="store",
+        type=float,
+        default=0.01,
+        help="Largest allowed drop of the F-score by pruning.",
+    )
 
     args = parser.parse_args()
 
-    main(args.test_file)
+    if args.command == "score":
+        score(
+            args.train_file,
+            args.input_file,
+            args.output_file,
+            args.binary,
+            not args.unlabeled,
+            args.chunk_size,
+            args.model_file,
+        )
+    elif args.command == "sweep":
+        sweep(
+            args.train_file,
+            args.validation_file,
+            args.output_file,
+            [float(d) for d in args.deltas.split(",")],
+            args.model_file,
+            [int(n) for n in args.max_features.split(",")]
+            if args.max_features
+            else None,
+            args.selection,
+            args.tolerance,
+        )
+    else:
+        main(
+            args.train_file,
+            args.test_file,
+            args.seed,
+            args.cache_dir,
+            args.jobs,
+            args.resume,
+            args.method,
+            args.adaptive_alpha,
+            args.model_dir,
+            args.progress_every,
+            args.profile_file,
+            args.summary_file,
+        )
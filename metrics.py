@@ -1,6 +1,305 @@
 """Evaluation metrics for classification systems.
+
+Metrics are computed for many systems (or many resamples) at once. Each row of
+0/1 values is packed into an integer with one byte per example, so the
+confusion counts of a row are the popcounts of a few bitwise ANDs instead of a
+Python loop over the examples. Integer weights, e.g., how many times a
+resample drew each example, are split into bit planes: plane k marks the
+examples whose weight has bit k set, and a weighted count is
+
+    sum(popcount(mask & plane_k) << k for each plane k)
 """
 
+from utils import popcount
+
+
+# Maps the values accepted as 0 and 1, e.g., False, 1.0 or numpy integers
+_BINARY = {0: 0, 1: 1}
+# _bit_planes[k] maps a byte of weights to bit k of it
+_bit_planes = [bytes((v >> k) & 1 for v in range(256)) for k in range(8)]
+
+
+def _pack(values) -> bytes:
+    """Pack a vector of 0/1 values into one byte per value.
+
+    Values which are not 0 or 1 are packed as 2, so callers can detect them.
+    """
+    if isinstance(values, (bytes, bytearray)):
+        return bytes(values)
+    try:
+        view = memoryview(values)
+    except TypeError:
+        view = None
+    if view is not None:
+        if view.ndim == 1 and view.itemsize == 1:
+            return view.tobytes()
+        values = view.tolist()
+    try:
+        return bytes(values)
+    except (TypeError, ValueError):
+        return bytes(_BINARY.get(v, 2) for v in values)
+
+
+def to_mask(values) -> int:
+    """Pack a vector of 0/1 values into an integer with one byte per value."""
+    return int.from_bytes(_pack(values), "little")
+
+
+def weight_planes(weights: list) -> list:
+    """Split non-negative integer weights into bit planes.
+
+    Parameters
+    ----------
+    weights : list[int]
+        The weight of each example.
+
+    Returns
+    -------
+    list[int]
+        Plane k, packed with one byte per example, marks the examples whose
+        weight has bit k set.
+    """
+    max_weight = max(weights, default=0)
+
+    if max_weight < 256:
+        weights = bytes(weights)
+        return [
+            int.from_bytes(weights.translate(_bit_planes[k]), "little")
+            for k in range(max_weight.bit_length())
+        ]
+    return [
+        to_mask([(w >> k) & 1 for w in weights])
+        for k in range(max_weight.bit_length())
+    ]
+
+
+def fscore_from_counts(
+    tp: int, fp: int, fn: int, beta: float = 1, zero_division: int = 0
+) -> float:
+    """Compute the fscore from confusion counts, as fscore does.
+
+    Parameters
+    ----------
+    tp : int
+        Number of true positives.
+    fp : int
+        Number of false positives.
+    fn : int
+        Number of false negatives.
+    beta : float, optional
+        Value such that recall is beta-times more weighted than precision,
+            by default 1.
+    zero_division : int, optional
+        Value to return when there are no true positives, by default 0.
+
+    Returns
+    -------
+    float
+        The fscore.
+    """
+    if tp == 0:
+        return zero_division
+    return ((1 + beta**2) * tp) / ((1 + beta**2) * tp + beta**2 * fn + fp)
+
+
+def confusion_counts(
+    predictions: list, labels: list, sample_weight: list = None
+) -> list:
+    """Count the true and false positives and negatives of each row.
+
+    Parameters
+    ----------
+    predictions : list[list[int]]
+        A rows by examples matrix of 0/1 predictions, e.g., one row per system.
+        Rows may be lists, bytearrays, arrays or numpy arrays.
+    labels : list[int]
+        Ground truth labels for the examples, consisting of values of 0 and 1.
+    sample_weight : list[int], optional
+        Non-negative integer weight of each example, e.g., how many times a
+            resample drew it, by default None, which weighs every example by 1.
+
+    Returns
+    -------
+    list[tuple[int, int, int, int]]
+        The numbers of true positives, false positives, false negatives and
+        true negatives of each row.
+
+    Raises
+    ------
+    ValueError
+        If the number of predictions in a row and labels is not equal.
+    ValueError
+        If an element of predictions or labels is not 0 or 1.
+    ValueError
+        If sample_weight does not hold one non-negative integer per example.
+    """
+    n = len(labels)
+    packed_labels = _pack(labels)
+    y = int.from_bytes(packed_labels, "little")
+
+    if sample_weight is None:
+        total, pos = n, popcount(y)
+
+        def weighted(mask: int) -> int:
+            return popcount(mask)
+
+    else:
+        if len(sample_weight) != n:
+            raise ValueError(
+                "Length of sample_weight and labels must be equal, but got "
+                f"{len(sample_weight)} weights and {n} labels."
+            )
+        if any(w < 0 or w != int(w) for w in sample_weight):
+            raise ValueError("sample_weight must consist of non-negative integers.")
+        planes = weight_planes([int(w) for w in sample_weight])
+
+        def weighted(mask: int) -> int:
+            return sum(popcount(mask & plane) << k for k, plane in enumerate(planes))
+
+        total, pos = sum(int(w) for w in sample_weight), weighted(y)
+
+    counts = []
+    for row in predictions:
+        if len(row) != n:
+            raise ValueError(
+                "Length of predictions and labels must be equal, but got "
+                f"{len(row)} predictions and {n} labels."
+            )
+        packed = _pack(row)
+        if (packed + packed_labels).translate(None, b"\x00\x01"):
+            for p, l in zip(row, labels):
+                if p not in (0, 1) or l not in (0, 1):
+                    raise ValueError(
+                        f"Unexpected value(s) in predictions or labels: {p, l}. "
+                        f"Expected either {1} or {0}."
+                    )
+        p = int.from_bytes(packed, "little")
+        tp = weighted(p & y)
+        fp = weighted(p) - tp
+        fn = pos - tp
+        counts.append((tp, fp, fn, total - tp - fp - fn))
+
+    return counts
+
+
+def classification_scores(
+    predictions: list,
+    labels: list,
+    beta: float = 1,
+    zero_division: int = 0,
+    sample_weight: list = None,
+) -> dict:
+    """Compute the confusion counts and scores of each row of predictions.
+
+    Parameters
+    ----------
+    predictions : list[list[int]]
+        A rows by examples matrix of 0/1 predictions, e.g., one row per system.
+    labels : list[int]
+        Ground truth labels for the examples, consisting of values of 0 and 1.
+    beta : float, optional
+        Value such that recall is beta-times more weighted than precision,
+            by default 1.
+    zero_division : int, optional
+        Value of a score whose denominator is zero, either 0 or 1, and of the
+            fscore when there are no true positives, by default 0.
+    sample_weight : list[int], optional
+        Non-negative integer weight of each example, by default None.
+
+    Returns
+    -------
+    dict[str, list]
+        One value per row for each of "tp", "fp", "fn", "tn", "fscore",
+        "precision", "recall" and "accuracy".
+
+    Raises
+    ------
+    ValueError
+        If the number of predictions in a row and labels is not equal.
+    ValueError
+        If zero_division is not 0 or 1.
+    ValueError
+        If an element of predictions or labels is not 0 or 1.
+
+    Usage
+    -----
+    >>> classification_scores([[1, 0, 1], [0, 0, 1]], [1, 1, 0])["recall"]
+    ... [0.5, 0.0]
+    """
+    if zero_division not in {0, 1}:
+        raise ValueError(f"zero_division must be 0 or 1, but got {zero_division}.")
+    counts = confusion_counts(predictions, labels, sample_weight)
+
+    def ratio(a: int, b: int) -> float:
+        return a / b if b else zero_division
+
+    scores = {
+        "tp": [],
+        "fp": [],
+        "fn": [],
+        "tn": [],
+        "fscore": [],
+        "precision": [],
+        "recall": [],
+        "accuracy": [],
+    }
+    for tp, fp, fn, tn in counts:
+        scores["tp"].append(tp)
+        scores["fp"].append(fp)
+        scores["fn"].append(fn)
+        scores["tn"].append(tn)
+        scores["fscore"].append(fscore_from_counts(tp, fp, fn, beta, zero_division))
+        scores["precision"].append(ratio(tp, tp + fp))
+        scores["recall"].append(ratio(tp, tp + fn))
+        scores["accuracy"].append(ratio(tp + tn, tp + fp + fn + tn))
+    return scores
+
+
+def fscores(
+    predictions: list,
+    labels: list,
+    beta: float = 1,
+    zero_division: int = 0,
+    sample_weight: list = None,
+) -> list:
+    """Compute the fscore of each row of predictions.
+
+    Parameters
+    ----------
+    predictions : list[list[int]]
+        A rows by examples matrix of 0/1 predictions, e.g., one row per system.
+    labels : list[int]
+        Ground truth labels for the examples, consisting of values of 0 and 1.
+    beta : float, optional
+        Value such that recall is beta-times more weighted than precision,
+            by default 1.
+    zero_division : int, optional
+        Value to return when there are no true positives, either 0 or 1,
+            by default 0.
+    sample_weight : list[int], optional
+        Non-negative integer weight of each example, by default None.
+
+    Returns
+    -------
+    list[float]
+        The fscore of each row.
+
+    Raises
+    ------
+    ValueError
+        If the number of predictions in a row and labels is not equal.
+    ValueError
+        If zero_division is not 0 or 1.
+    ValueError
+        If an element of predictions or labels is not 0 or 1.
+    """
+    if zero_division not in {0, 1}:
+        raise ValueError(f"zero_division must be 0 or 1, but got {zero_division}.")
+    return [
+        fscore_from_counts(tp, fp, fn, beta, zero_division)
+        for tp, fp, fn, _ in confusion_counts(predictions, labels, sample_weight)
+    ]
+
 
 def fscore(
     predictions: list, labels: list, beta: float = 1, zero_division: int = 0
@@ -40,29 +339,5 @@ def fscore(
             "Length of predictions and labels must be equal, but got "
             f"{len(predictions)} predictions and {len(labels)} labels."
         )
-    if zero_division not in {0, 1}:
-        raise ValueError(f"zero_division must be 0 or 1, but got {zero_division}.")
-
-    tp, fp, fn, tn = 0, 0, 0, 0
-
-    for p, l in zip(predictions, labels):
-        if p == 1 and l == 1:
-            tp += 1
-        elif p == 1 and l == 0:
-            fp += 1
-        elif p == 0 and l == 1:
-            fn += 1
-        elif p == 0 and l == 0:
-            tn += 1
-        else:
-            raise ValueError(
-                f"Unexpected value(s) in predictions or labels: {p, l}. "
-                f"Expected either {1} or {0}."
-            )
-
-    if tp == 0:
-        return zero_division
-
-    f = ((1 + beta**2) * tp) / ((1 + beta**2) * tp + beta**2 * fn + fp)
 
-    return f
+    return fscores([predictions], labels, beta, zero_division)[0]
@@ -1,23 +1,97 @@
-"""Multinomial Naive Bayes Classifier for binary text classification tasks.
-
-TODO:
-- Implement binary mode for the classifier, i.e., T5. One way to do this is to
-    add an additional parameter to the santiize function. When this parameter
-    is properly set, the sanitize function can remove non-unique tokens. Then,
-    in both the NaiveBayesClassifier.fit and the NaiveBayesClassifier.predict
-    methods, change the call to sanitize to include the new parameter. When the
-    NaiveBayesClassifier is instantiated with the mode="binary" flag, the new
-    parameter should be set such that the sanitize function will remove
-    duplicates from the string.
-- Use log space for the prediction calculation. To do this, you'll need to
-    modify the NaiveBayesClassifier.predict method.
-"""
-
+"""Multinomial Naive Bayes Classifier for text classification tasks."""
 
 from __future__ import annotations
-from collections import Counter
+from array import array
+from collections import Counter, OrderedDict
+from itertools import repeat
+import json
 import math
+import mmap
+from operator import add
+import os
+from pathlib import Path
 import re
+from string import ascii_letters
+import struct
+
+from sparse import CSRMatrix, FeatureHasher, Vocabulary
+from utils import batched
+
+
+# A saved classifier is laid out as follows, with numbers in native byte order
+# and words sorted so that their ids are the same in every saved model:
+#
+#     magic          8 bytes, b"NBMODEL5"
+#     header         10 x uint64: n_words, n_classes, words size, labels size,
+#                    binary, n_features, smallest and largest n of the n-grams,
+#                    max_features, index of selection in SELECTIONS
+#                    4 x float64: min_count, delta, min_df, max_df
+#     word offsets   (n_words + 1) x uint64
+#     n_docs         n_classes x float64
+#     n_tokens       n_classes x float64
+#     n_w            n_classes x n_words x float64, one class after the other
+#     n_df           n_words x float64, only if it is kept
+#     log_p_w        n_words x n_classes x float32, one word after the other
+#     log_ratio      n_words x float32, only if there are two classes
+#     words          the UTF-8 encoded words, concatenated
+#     labels         the labels of the classes, as a JSON list
+#
+# The words of n-grams are joined by spaces and max_features is 0 if there is
+# no such limit. In hashing mode, n_features is the number of buckets and
+# n_words is equal to it, while there are no word offsets and no words.
+# Otherwise n_features is 0, and the features which min_count, min_df or max_df
+# leave out are not saved.
+MODEL_MAGIC = b"NBMODEL5"
+MODEL_HEADER = struct.Struct("=10Q4d")
+
+# Criteria by which max_features selects features, stored by their index
+SELECTIONS = ("count", "log_odds", "mi", "chi2")
+
+# Number of documents partial_fit counts at once. With max_features, the
+# features are pruned whenever there are more than twice as many after a chunk,
+# and at the end of every update.
+FIT_CHUNK_SIZE = 10_000
+
+
+class _SanitizeTable(dict):
+    """Translation table which maps characters the way sanitize does.
+
+    Separators become spaces, ASCII letters are kept and every other character
+    is deleted. Characters outside of ASCII are classified on first use.
+    """
+
+    separators = frozenset(" -\n?!;.")
+    letters = frozenset(ascii_letters)
+
+    def __missing__(self, c: int):
+        ch = chr(c)
+        if ch in self.separators:
+            value = " "
+        elif ch in self.letters:
+            value = c
+        else:
+            value = None
+        self[c] = value
+        return value
+
+
+_sanitize_table = _SanitizeTable()
+
+
+def tokenize(text: str) -> list:
+    """Split text into the tokens that sanitize would produce, in one pass.
+
+    Parameters
+    ----------
+    text : str
+        Text to be tokenized.
+
+    Returns
+    -------
+    list[str]
+        The lowercase tokens of the text, in order.
+    """
+    return text.lower().translate(_sanitize_table).split()
 
 
 def sanitize(text: str, binary: bool) -> str:
@@ -35,17 +109,110 @@ def sanitize(text: str, binary: bool) -> str:
     str
         Sanitized text.
     """
-    text = text.lower()
-    text = re.sub("[-\n]+", " ", text)
-    text = re.sub("[?!;\.]+", " ", text)
-    text = re.sub("[^a-zA-Z\. ]+", "", text)
-    text = re.sub("[\s]{2,}", " ", text)
-    text = text.strip()
+    tokens = tokenize(text)
 
     if binary:
-        text = " ".join(set(text.split()))
+        tokens = dict.fromkeys(tokens)
 
-    return text
+    return " ".join(tokens)
+
+
+class TokenCache:
+    """Bounded cache of tokenized documents shared between classifiers.
+
+    Documents are tokenized once. The count view is the token sequence and
+    the binary view, its unique tokens, is derived from it on first use. When
+    more than max_tokens tokens are held, the least recently used documents are
+    evicted.
+
+    Attributes
+    ----------
+    max_tokens : int
+        Maximum number of tokens held in the cache.
+    n_tokens : int
+        Number of tokens currently held in the cache.
+    hits : int
+        Number of lookups answered from the cache.
+    misses : int
+        Number of lookups which required tokenization.
+
+    Usage
+    -----
+    >>> cache = TokenCache()
+    >>> cache.tokens("Great, great phone!")
+    ... ('great', 'great', 'phone')
+    >>> cache.unique("Great, great phone!")
+    ... ('great', 'phone')
+    """
+
+    def __init__(self, max_tokens: int = 1_000_000) -> None:
+        """Create an empty cache.
+
+        Parameters
+        ----------
+        max_tokens : int, optional
+            Maximum number of tokens held in the cache, by default 1_000_000.
+        """
+        self.max_tokens = max_tokens
+        self.n_tokens = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def _entry(self, text: str) -> list:
+        entry = self._entries.get(text)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(text)
+            return entry
+
+        self.misses += 1
+        entry = [tuple(tokenize(text)), None]
+        self._entries[text] = entry
+        self.n_tokens += len(entry[0])
+        while self.n_tokens > self.max_tokens and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.n_tokens -= len(evicted[0])
+        return entry
+
+    def tokens(self, text: str) -> tuple:
+        """Return the tokens of a document.
+
+        Parameters
+        ----------
+        text : str
+            The document.
+
+        Returns
+        -------
+        tuple[str]
+            The tokens of the document, in order.
+        """
+        return self._entry(text)[0]
+
+    def unique(self, text: str) -> tuple:
+        """Return the unique tokens of a document.
+
+        Parameters
+        ----------
+        text : str
+            The document.
+
+        Returns
+        -------
+        tuple[str]
+            The tokens of the document without repetitions, in order of first
+            appearance.
+        """
+        entry = self._entry(text)
+        if entry[1] is None:
+            entry[1] = tuple(dict.fromkeys(entry[0]))
+        return entry[1]
+
+    def clear(self) -> None:
+        """Remove every document from the cache."""
+        self._entries.clear()
+        self.n_tokens = 0
 
 
 def p_w_cls(n_k: int, delta: float, n_c: int, n_v: int) -> float:
@@ -70,25 +237,161 @@ def p_w_cls(n_k: int, delta: float, n_c: int, n_v: int) -> float:
     return (n_k + delta) / (n_c + delta * n_v)
 
 
+_nonzero_bytes = re.compile(rb"[^\x00]+")
+
+
+def nonzero(values: array) -> list:
+    """Return the indices of the nonzero entries of an array of doubles.
+
+    Counts are mostly zero in hashing mode, so the zero bytes are skipped by a
+    regular expression rather than looking at each entry in Python.
+    """
+    ids = []
+    end = 0
+    for run in _nonzero_bytes.finditer(memoryview(values).cast("B")):
+        start = max(run.start() // 8, end)
+        end = (run.end() - 1) // 8 + 1
+        ids.extend(range(start, end))
+    return ids
+
+
+def log(p: float) -> float:
+    """Return the natural log of a probability, which may be zero."""
+    return math.log(p) if p > 0 else -math.inf
+
+
+def softplus(z: float) -> float:
+    """Return log(1 + exp(z)) without overflowing for large z."""
+    return max(z, 0) + math.log1p(math.exp(-abs(z)))
+
+
+def log_softmax(scores: list) -> list:
+    """Normalize log scores into log probabilities without overflowing."""
+    top = max(scores)
+    if top == -math.inf:
+        return [-math.log(len(scores))] * len(scores)
+    total = top + math.log(sum(math.exp(s - top) for s in scores))
+    return [s - total for s in scores]
+
+
 class NaiveBayesClassifier:
-    """Multinomial Naive Bayes Classifier for binary text classification tasks.
+    """Multinomial Naive Bayes Classifier for text classification tasks.
+
+    The classifier keeps the raw counts of its training data, so it can be
+    updated with more data or merged with classifiers trained on other shards.
+    The probabilities are derived from the counts when first needed and cached
+    until the counts or delta change.
+
+    Any number of classes with any labels are learned. Labels 0 and 1 are the
+    negative and the positive class of a binary classifier, whose scores are
+    the log odds of the positive class. With other labels, every document is
+    scored against all classes in one pass over its words, which adds up the
+    rows of log_p_w.
 
     Attributes
     ----------
     mode : str
         If true, only considers binary features.
     delta : float
-        A smoothing parameter.
-    p_neg : float
-        The probability of a document belonging to the negative class based
-        soley upon the distribution of the training data.
-    p_pos : float
-        The probability of a document belonging to the positive class based
-        soley upon the distribution of the training data.
-    p_w_neg : dict[str, float]
-        The probability of a word occuring given the negative class.
-    p_w_pos : dict[str, float]
-        The probability of a word occuring given the positive class.
+        A smoothing parameter. Changing it does not require refitting.
+    backend : str
+        Either "dict", which scores documents word by word, or "sparse", which
+        encodes documents as a sparse document-term matrix and scores a whole
+        batch with one matrix-vector product.
+    cache : TokenCache
+        Cache of tokenized documents, which may be shared between classifiers.
+    hashing : bool
+        If true, words are hashed into n_features buckets instead of being
+        kept in a vocabulary, so the size of the model is fixed. Word ids are
+        then bucket numbers.
+    n_features : int
+        Number of buckets in hashing mode.
+    ngram_range : tuple[int, int]
+        The smallest and largest n of the n-grams used as features. Unigrams
+        are words. With a vocabulary, longer n-grams are the ids of their
+        tokens in token_vocabulary packed into one integer, and in hashing
+        mode, their tokens joined by spaces. In binary mode, each n-gram
+        counts once per document.
+    min_count : float
+        Features seen fewer times in the training data are left out of the
+        parameters. Their counts are kept in memory, so that later updates
+        count them as if all the data had been fitted at once, but save and
+        prune drop them. A loaded or pruned classifier thus counts them from
+        zero again.
+    max_features : int | None
+        If not None, all but the max_features best features by selection are
+        pruned, i.e., their counts are dropped. Features which min_count,
+        min_df or max_df leave out rank last. Since updates prune as they go,
+        features dropped by one update start from zero in the next, so the
+        kept features are only approximately those of one fit on all data.
+    min_df : float
+        Features in fewer (weighted) training documents are left out of the
+        parameters, and of saved and pruned models, like those below
+        min_count.
+    max_df : float
+        Features in more than this fraction of the training documents are
+        left out like those below min_df. If later documents bring such a
+        feature below max_df, a model which dropped it only holds the later
+        counts.
+    selection : str
+        How max_features ranks features: "count" by their number of
+        occurrences, "log_odds" by the largest difference between their log
+        probabilities given two classes, and "mi" or "chi2" by the mutual
+        information or chi-squared statistic of their occurrence and the class.
+        These compare documents with and without a feature in binary mode, and
+        tokens otherwise.
+    vocabulary : Vocabulary | FeatureHasher
+        The ids of the features seen during training.
+    token_vocabulary : Vocabulary | None
+        The ids of the tokens of n-grams, if n-grams longer than one are packed.
+    classes : list
+        The label of each class, in the order of the columns of log_p_w. With
+        labels 0 and 1 only, the classes are [0, 1], even if only one of them
+        has been seen so far. That class is then empty, but is not stored, so
+        that later labels do not find it. Otherwise the classes are kept in
+        order of first appearance, sorted within each update if the new labels
+        can be compared.
+    n_docs : array.array
+        The (weighted) number of training documents in each class. This and
+        n_tokens and n_w are read-only, in the order of classes.
+    n_tokens : array.array
+        The number of tokens in training documents of each class.
+    n_w : list[array.array]
+        The number of occurences of each word id in each class.
+    n_df : array.array | None
+        The (weighted) number of training documents with each word id, which
+        is kept only for min_df and max_df and if not in binary mode, where it
+        is the sum of n_w.
+    priors : list[float]
+        The probability of a document belonging to each class based soley upon
+        the distribution of the training data.
+    log_prior : array.array
+        The log probability of each class.
+    log_p_w : array.array
+        The vocabulary x classes matrix of the log probability of each word id
+        given each class, stored row by row, so that the log probabilities of
+        word id i are log_p_w[i * len(classes) : (i + 1) * len(classes)]. The
+        rows of empty buckets in hashing mode, and of features which min_count,
+        min_df or max_df leave out, are zero, so that their words are ignored.
+    log_ratio : array.array
+        The difference between the log probabilities of each word id given the
+        positive and the negative class, i.e., how much one occurrence of the
+        word adds to the decision function. None unless there are two classes.
+    n_docs_neg, n_docs_pos, n_tokens_neg, n_tokens_pos : float
+        The counts of the negative and the positive class, i.e., of the first
+        and the second class.
+    n_w_neg, n_w_pos : array.array
+        The counts of each word id in the negative and the positive class.
+    p_neg, p_pos : float
+        The prior probabilities of the negative and the positive class.
+    log_p_w_neg, log_p_w_pos : array.array
+        The columns of log_p_w of the negative and the positive class.
+    p_w_neg : dict[str | int, float]
+        The probability of a word, or of a bucket in hashing mode, occuring
+        given the negative class.
+    p_w_pos : dict[str | int, float]
+        The probability of a word, or of a bucket in hashing mode, occuring
+        given the positive class.
 
     Usage
     -----
@@ -98,10 +401,39 @@ class NaiveBayesClassifier:
     >>> clf = NaiveBayesClassifier()
     >>> clf.fit(x_train, y_train)
     >>> clf.predict(x_test)
-    ... [1, 0]
+    ... [1, 1]
+    >>> clf.decision_function(["I hate this movie"])
+    ... [-0.0816...]
+    >>> list(clf.predict_iter(iter(x_test), chunk_size=1))
+    ... [1, 1]
+    >>> clf.partial_fit(["I hate it", "What a waste"], [0, 0])
+    >>> clf.predict(x_test)
+    ... [0, 0]
+    >>> stars = NaiveBayesClassifier().fit(x_train, [5, 4, 1])
+    >>> stars.classes, stars.predict(["I hate this movie"])
+    ... ([1, 4, 5], [1])
+    >>> fans = NaiveBayesClassifier().fit(x_train, [1, 1, 1])
+    >>> fans.classes, fans.predict(["I hate this movie"])
+    ... ([0, 1], [1])
+    >>> fans.partial_fit(["It was fine"], [2]).classes
+    ... [1, 2]
     """
 
-    def __init__(self, binary: bool = False, delta: float = 1) -> None:
+    def __init__(
+        self,
+        binary: bool = False,
+        delta: float = 1,
+        backend: str = "dict",
+        cache: TokenCache = None,
+        hashing: bool = False,
+        n_features: int = 2**20,
+        ngram_range: tuple = (1, 1),
+        min_count: float = 1,
+        max_features: int = None,
+        min_df: float = 1,
+        max_df: float = 1.0,
+        selection: str = "count",
+    ) -> None:
         """Create a classifier.
 
         Parameters
@@ -110,13 +442,765 @@ class NaiveBayesClassifier:
             If true, only considers binary features, default False.
         delta : float, optional
             A smoothing parameter., by default 1
+        backend : str, optional
+            Either "dict" or "sparse", by default "dict".
+        cache : TokenCache, optional
+            Cache of tokenized documents, by default None, which tokenizes
+            every document on every call.
+        hashing : bool, optional
+            If true, hash words into n_features buckets instead of keeping a
+            vocabulary, by default False.
+        n_features : int, optional
+            Number of buckets in hashing mode, by default 2**20.
+        ngram_range : tuple[int, int], optional
+            The smallest and largest n of the n-grams used as features, by
+            default (1, 1), which only uses words.
+        min_count : float, optional
+            Features seen fewer times in the training data are left out of the
+            parameters and of saved models, by default 1, which keeps every
+            feature. This, min_df and max_df do not apply in hashing mode.
+        max_features : int, optional
+            If given, all but the max_features best features by selection are
+            pruned after every update, by default None.
+        min_df : float, optional
+            Features in fewer (weighted) training documents are left out of the
+            parameters and of saved models, by default 1, which keeps every
+            feature.
+        max_df : float, optional
+            Features in more than this fraction of the training documents are
+            left out of the parameters and of saved models, by default 1.0,
+            which keeps every feature.
+        selection : str, optional
+            One of "count", "log_odds", "mi" and "chi2", by default "count",
+            which keeps the most frequent features.
+
+        Raises
+        ------
+        ValueError
+            If backend is not "dict" or "sparse".
+        ValueError
+            If n_features is not positive.
+        ValueError
+            If ngram_range is not a pair 1 <= lo <= hi.
+        ValueError
+            If max_df is not in (0, 1].
+        ValueError
+            If selection is unknown.
         """
+        if backend not in {"dict", "sparse"}:
+            raise ValueError(f"backend must be dict or sparse, but got {backend}.")
+        if n_features < 1:
+            raise ValueError(f"n_features must be positive, but got {n_features}.")
+        lo, hi = ngram_range
+        if not 1 <= lo <= hi:
+            raise ValueError(
+                f"ngram_range must satisfy 1 <= lo <= hi, but got {ngram_range}."
+            )
+        if not 0 < max_df <= 1:
+            raise ValueError(f"max_df must be in (0, 1], but got {max_df}.")
+        if selection not in SELECTIONS:
+            raise ValueError(
+                f"selection must be one of {', '.join(SELECTIONS)}, but got "
+                f"{selection}."
+            )
+
         self.binary = binary
         self.delta = delta
-        self.p_neg = None
-        self.p_pos = None
-        self.p_w_neg = None
-        self.p_w_pos = None
+        self.backend = backend
+        self.cache = cache
+        self.hashing = hashing
+        self.n_features = n_features
+        self.ngram_range = (lo, hi)
+        self.min_count = min_count
+        self.max_features = max_features
+        self.min_df = min_df
+        self.max_df = max_df
+        self.selection = selection
+        self.vocabulary = None
+        self.token_vocabulary = None
+        self._classes = []
+        self._n_docs = array("d")
+        self._n_tokens = array("d")
+        self._n_w = []
+        self.n_df = None
+
+    @property
+    def delta(self) -> float:
+        """A smoothing parameter."""
+        return self._delta
+
+    @delta.setter
+    def delta(self, delta: float) -> None:
+        self._delta = delta
+        self._params = None
+
+    def _missing(self) -> int:
+        """Return the binary class which has not been seen yet, or None."""
+        if len(self._classes) == 1 and self._classes[0] in (0, 1):
+            return 1 - self._classes[0]
+        return None
+
+    @property
+    def classes(self) -> list:
+        """The label of each class, in the order of the columns of log_p_w."""
+        missing = self._missing()
+        if missing is None:
+            return self._classes
+        # Labels 0 and 1 are also the positions of their classes
+        classes = list(self._classes)
+        classes.insert(missing, missing)
+        return classes
+
+    @property
+    def n_docs(self) -> array:
+        """The (weighted) number of training documents in each class."""
+        missing = self._missing()
+        if missing is None:
+            return self._n_docs
+        n_docs = array("d", self._n_docs)
+        n_docs.insert(missing, 0.0)
+        return n_docs
+
+    @property
+    def n_tokens(self) -> array:
+        """The number of tokens in training documents of each class."""
+        missing = self._missing()
+        if missing is None:
+            return self._n_tokens
+        n_tokens = array("d", self._n_tokens)
+        n_tokens.insert(missing, 0.0)
+        return n_tokens
+
+    @property
+    def n_w(self) -> list:
+        """The number of occurences of each word id in each class."""
+        missing = self._missing()
+        if missing is None:
+            return self._n_w
+        n_w = list(self._n_w)
+        n_w.insert(missing, array("d", bytes(8 * len(n_w[0]))))
+        return n_w
+
+    def _parameters(self) -> dict:
+        """Derive the probabilities from the counts, or return the cached ones."""
+        if self._params is not None or self.vocabulary is None:
+            return self._params
+
+        k = len(self.classes)
+        kept, nonzeros = self._smoothing()
+        n_v = len(kept)
+        n = sum(self.n_docs)
+        priors = [c / n for c in self.n_docs]
+
+        # Determine the log probability of a word given each class once, so
+        # that scoring only needs to add up the rows of its words. Words in
+        # empty buckets were never seen, and words the cutoffs leave out are
+        # not features, so their rows stay zero and they are ignored like
+        # words outside of the vocabulary.
+        log_p_w = array("d", bytes(8 * k * len(self.vocabulary)))
+        for c, (counts, ids) in enumerate(zip(self.n_w, nonzeros)):
+            n_c = len(ids)
+            unseen = math.log(p_w_cls(0, self.delta, n_c, n_v))
+            for i in kept:
+                log_p_w[i * k + c] = unseen
+            for i in ids:
+                p_w = p_w_cls(counts[i], self.delta, n_c, n_v)
+                log_p_w[i * k + c] = math.log(p_w)
+        log_ratio = None
+        if k == 2:
+            log_ratio = array("d", bytes(8 * len(self.vocabulary)))
+            for i in kept:
+                log_ratio[i] = log_p_w[2 * i + 1] - log_p_w[2 * i]
+        self._params = {
+            "priors": priors,
+            "log_prior": array("d", map(log, priors)),
+            "log_p_w": log_p_w,
+            "log_ratio": log_ratio,
+        }
+        return self._params
+
+    def _smoothing(self) -> tuple:
+        """Return the features which are kept and those seen in each class.
+
+        Left out are the empty buckets in hashing mode, and otherwise the
+        features which min_count, min_df or max_df cut. The kept features make
+        up the vocabulary which is smoothed over, and the features seen in a
+        class its size.
+        """
+        nonzeros = [nonzero(counts) for counts in self.n_w]
+        if self.hashing:
+            # Only the buckets which words fell into make up the vocabulary
+            kept = sorted(set().union(*nonzeros))
+        else:
+            kept = range(len(self.vocabulary))
+            cut = set(self._cut())
+            if cut:
+                kept = [i for i in kept if i not in cut]
+                nonzeros = [[i for i in ids if i not in cut] for ids in nonzeros]
+        return kept, nonzeros
+
+    def _cut(self) -> list:
+        """Return the ids of the features left out by min_count, min_df or max_df."""
+        if self.min_count <= 1 and self.min_df <= 1 and self.max_df >= 1:
+            return []
+        totals = [sum(row) for row in zip(*self.n_w)]
+        cut = [i for i, c in enumerate(totals) if c < self.min_count]
+        if self.min_df > 1 or self.max_df < 1:
+            df = totals if self.binary else self.n_df
+            most = self.max_df * sum(self.n_docs)
+            cut = sorted(
+                set(cut).union(
+                    i for i, n in enumerate(df) if not self.min_df <= n <= most
+                )
+            )
+        return cut
+
+    def _param(self, name: str):
+        """Return one of the derived parameters, or None before fitting."""
+        params = self._parameters()
+        return None if params is None else params[name]
+
+    @property
+    def priors(self) -> list:
+        """The probability of a document belonging to each class."""
+        return self._param("priors")
+
+    @property
+    def log_prior(self) -> array:
+        """The log probability of each class."""
+        return self._param("log_prior")
+
+    @property
+    def log_p_w(self) -> array:
+        """The log probability of each word id given each class, row by row."""
+        return self._param("log_p_w")
+
+    @property
+    def log_ratio(self) -> array:
+        """The difference between log_p_w_pos and log_p_w_neg."""
+        return self._param("log_ratio")
+
+    @property
+    def n_docs_neg(self) -> float:
+        """The (weighted) number of training documents in the negative class."""
+        return self.n_docs[0] if self.n_docs else 0
+
+    @property
+    def n_docs_pos(self) -> float:
+        """The (weighted) number of training documents in the positive class."""
+        return self.n_docs[1] if len(self.n_docs) > 1 else 0
+
+    @property
+    def n_tokens_neg(self) -> float:
+        """The number of tokens in training documents of the negative class."""
+        return self.n_tokens[0] if self.n_tokens else 0
+
+    @property
+    def n_tokens_pos(self) -> float:
+        """The number of tokens in training documents of the positive class."""
+        return self.n_tokens[1] if len(self.n_tokens) > 1 else 0
+
+    @property
+    def n_w_neg(self) -> array:
+        """The number of occurences of each word id in the negative class."""
+        return self.n_w[0] if self.n_w else None
+
+    @property
+    def n_w_pos(self) -> array:
+        """The number of occurences of each word id in the positive class."""
+        return self.n_w[1] if len(self.n_w) > 1 else None
+
+    @property
+    def p_neg(self) -> float:
+        """The probability of a document belonging to the negative class."""
+        priors = self.priors
+        return None if priors is None else priors[0]
+
+    @property
+    def p_pos(self) -> float:
+        """The probability of a document belonging to the positive class."""
+        priors = self.priors
+        return None if priors is None else priors[1]
+
+    @property
+    def log_p_w_neg(self) -> array:
+        """The log probability of each word id given the negative class."""
+        log_p_w = self.log_p_w
+        return None if log_p_w is None else log_p_w[0 :: len(self.classes)]
+
+    @property
+    def log_p_w_pos(self) -> array:
+        """The log probability of each word id given the positive class."""
+        log_p_w = self.log_p_w
+        return None if log_p_w is None else log_p_w[1 :: len(self.classes)]
+
+    def _keys(self) -> list:
+        """Return the word of each id, or the ids themselves in hashing mode."""
+        if self.hashing:
+            return range(self.n_features)
+        if self.token_vocabulary is not None:
+            return [self._name(key) for key in self.vocabulary.words]
+        return self.vocabulary.words
+
+    def _p_w(self, log_p_w: array) -> dict:
+        """Return the probability of each feature which is not ignored."""
+        if log_p_w is None:
+            return None
+        keys = self._keys()
+        return {keys[i]: math.exp(log_p_w[i]) for i in self._smoothing()[0]}
+
+    @property
+    def p_w_neg(self) -> dict:
+        """The probability of a word occuring given the negative class."""
+        return self._p_w(self.log_p_w_neg)
+
+    @property
+    def p_w_pos(self) -> dict:
+        """The probability of a word occuring given the positive class."""
+        return self._p_w(self.log_p_w_pos)
+
+    def __getstate__(self) -> dict:
+        # Only the counts are pickled. The probabilities are derived again
+        # when needed and the token cache stays with the process that owns it.
+        state = self.__dict__.copy()
+        state["cache"] = None
+        state["_params"] = None
+        state["_n_w"] = [array("d", counts) for counts in self._n_w]
+        if self.n_df is not None:
+            state["n_df"] = array("d", self.n_df)
+        return state
+
+    def save(self, path: str) -> None:
+        """Write the classifier to a model file.
+
+        The file holds the counts, so a loaded classifier can still be updated,
+        and the log probabilities as float32, so it can score right away.
+
+        Parameters
+        ----------
+        path : str
+            Location of the model file.
+
+        Raises
+        ------
+        ValueError
+            If the classifier was not fitted prior to calling save.
+        """
+        if self.log_prior is None:
+            raise ValueError("The classifier has not been fitted yet.")
+
+        k = len(self.classes)
+        blob = array("B")
+        if self.hashing:
+            # Buckets keep their numbers, so the sections are plain copies
+            order = None
+            sections = []
+        else:
+            # Features which the cutoffs leave out are not saved, see prune
+            cut = set(self._cut())
+            words = self._keys()
+            order = sorted(
+                (i for i in range(len(words)) if i not in cut), key=words.__getitem__
+            )
+            word_offsets = array("Q", [0])
+            for i in order:
+                blob.frombytes(words[i].encode("utf-8"))
+                word_offsets.append(len(blob))
+            sections = [word_offsets]
+
+        def section(typecode: str, values, width: int = 1) -> array:
+            """Return the rows of values in the order of the saved words."""
+            if order is None:
+                return array(typecode, values)
+            return array(
+                typecode,
+                (values[i * width + c] for i in order for c in range(width)),
+            )
+
+        sections.append(array("d", self.n_docs))
+        sections.append(array("d", self.n_tokens))
+        for counts in self.n_w:
+            sections.append(section("d", counts))
+        if self.n_df is not None:
+            sections.append(section("d", self.n_df))
+        sections.append(section("f", self.log_p_w, k))
+        if k == 2:
+            sections.append(section("f", self.log_ratio))
+        labels = json.dumps(self.classes).encode("utf-8")
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(MODEL_MAGIC)
+            f.write(
+                MODEL_HEADER.pack(
+                    len(self.vocabulary) if order is None else len(order),
+                    k,
+                    len(blob),
+                    len(labels),
+                    self.binary,
+                    self.n_features if self.hashing else 0,
+                    *self.ngram_range,
+                    self.max_features or 0,
+                    SELECTIONS.index(self.selection),
+                    self.min_count,
+                    self.delta,
+                    self.min_df,
+                    self.max_df,
+                )
+            )
+            for section in sections:
+                f.write(memoryview(section).cast("B"))
+            f.write(blob)
+            f.write(labels)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(
+        cls, path: str, backend: str = "dict", cache: TokenCache = None
+    ) -> NaiveBayesClassifier:
+        """Load a classifier from a model file by memory mapping it.
+
+        Parameters
+        ----------
+        path : str
+            Location of the model file.
+        backend : str, optional
+            Either "dict" or "sparse", by default "dict".
+        cache : TokenCache, optional
+            Cache of tokenized documents, by default None.
+
+        Returns
+        -------
+        NaiveBayesClassifier
+            The classifier. Its arrays are read-only views of the file, which
+            are copied only if the classifier is updated.
+
+        Raises
+        ------
+        ValueError
+            If the file is not a model file.
+        """
+        with open(path, "rb") as f:
+            buf = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        if buf[: len(MODEL_MAGIC)] != MODEL_MAGIC:
+            raise ValueError(f"{path} is not a model file.")
+        (
+            n_words,
+            k,
+            n_blob,
+            n_labels,
+            binary,
+            n_features,
+            lo,
+            hi,
+            max_features,
+            selection,
+            min_count,
+            delta,
+            min_df,
+            max_df,
+        ) = MODEL_HEADER.unpack_from(buf, len(MODEL_MAGIC))
+        clf = cls(
+            bool(binary),
+            delta,
+            backend,
+            cache,
+            bool(n_features),
+            n_features or 2**20,
+            (lo, hi),
+            min_count,
+            max_features or None,
+            min_df,
+            max_df,
+            SELECTIONS[selection],
+        )
+        clf._reset()
+
+        sections = []
+        start = len(MODEL_MAGIC) + MODEL_HEADER.size
+        layout = (
+            [("Q", 0 if n_features else n_words + 1), ("d", k), ("d", k)]
+            + [("d", n_words)] * k
+            + [("d", n_words if clf.n_df is not None else 0)]
+            + [("f", n_words * k), ("f", n_words if k == 2 else 0)]
+        )
+        for fmt, n in layout:
+            end = start + struct.calcsize(fmt) * n
+            sections.append(buf[start:end].cast(fmt))
+            start = end
+        word_offsets, n_docs, n_tokens, *n_w, n_df, log_p_w, log_ratio = sections
+        text = bytes(buf[start : start + n_blob])
+        labels = json.loads(bytes(buf[start + n_blob : start + n_blob + n_labels]))
+
+        if not n_features:
+            clf.vocabulary = Vocabulary(
+                clf._key(text[s:e].decode("utf-8"))
+                for s, e in zip(word_offsets, word_offsets[1:])
+            )
+        clf._classes = labels
+        clf._n_docs = array("d", n_docs)
+        clf._n_tokens = array("d", n_tokens)
+        clf._n_w = n_w
+        if clf.n_df is not None:
+            clf.n_df = n_df
+
+        n = sum(clf.n_docs)
+        priors = [c / n for c in clf.n_docs]
+        clf._params = {
+            "priors": priors,
+            "log_prior": array("d", map(log, priors)),
+            "log_p_w": log_p_w,
+            "log_ratio": log_ratio if k == 2 else None,
+        }
+        return clf
+
+    def _tokenize(self, x: list, add: bool = False) -> list:
+        """Turn documents into their features, keeping unique ones in binary mode.
+
+        With add, the tokens of n-grams are added to token_vocabulary.
+        Otherwise n-grams with unknown tokens are left out.
+        """
+        if self.ngram_range == (1, 1):
+            if self.cache is not None:
+                view = self.cache.unique if self.binary else self.cache.tokens
+                return [view(x_i) for x_i in x]
+            if self.binary:
+                return [list(dict.fromkeys(tokenize(x_i))) for x_i in x]
+            return [tokenize(x_i) for x_i in x]
+
+        # Repeated tokens are only removed from the n-grams, so that n-grams
+        # are formed from the full documents
+        if self.cache is not None:
+            tokens = [self.cache.tokens(x_i) for x_i in x]
+        else:
+            tokens = [tokenize(x_i) for x_i in x]
+        features = [self._ngrams(t, add) for t in tokens]
+        if self.binary:
+            return [list(dict.fromkeys(f)) for f in features]
+        return features
+
+    def _ngrams(self, tokens: list, add: bool) -> list:
+        """Return the n-grams of a tokenized document in one pass over it."""
+        lo, hi = self.ngram_range
+        features = []
+        if self.hashing:
+            for i in range(len(tokens)):
+                for n in range(lo, min(hi, len(tokens) - i) + 1):
+                    features.append(" ".join(tokens[i : i + n]))
+            return features
+
+        get = self.token_vocabulary.add if add else self.token_vocabulary.get
+        ids = [get(w) for w in tokens]
+        for i, w in enumerate(tokens):
+            if lo == 1:
+                features.append(w)
+            # Token id t is stored as t + 1, so n-grams of different lengths
+            # never share a key
+            key = 0
+            for n in range(min(hi, len(tokens) - i)):
+                t = ids[i + n]
+                if t is None:
+                    break
+                key |= (t + 1) << (32 * n)
+                if n + 1 >= max(lo, 2):
+                    features.append(key)
+        return features
+
+    def _name(self, key) -> str:
+        """Return the words of a feature, joined by spaces for n-grams."""
+        if isinstance(key, str):
+            return key
+        words = self.token_vocabulary.words
+        parts = []
+        while key:
+            parts.append(words[(key & 0xFFFFFFFF) - 1])
+            key >>= 32
+        return " ".join(parts)
+
+    def _key(self, name: str):
+        """Return the feature of words joined by spaces, adding its tokens."""
+        if self.token_vocabulary is None or " " not in name:
+            return name
+        key = 0
+        for n, w in enumerate(name.split(" ")):
+            key |= (self.token_vocabulary.add(w) + 1) << (32 * n)
+        return key
+
+    def _feature_scores(self) -> list:
+        """Return how much each feature tells the classes apart, by selection."""
+        if self.selection == "count":
+            return [sum(row) for row in zip(*self.n_w)]
+
+        if self.selection == "log_odds":
+            kept, nonzeros = self._smoothing()
+            n_v = len(kept)
+            n_cs = [len(ids) for ids in nonzeros]
+            scores = []
+            for row in zip(*self.n_w):
+                logs = [
+                    math.log(p_w_cls(n_k, self.delta, n_c, n_v))
+                    for n_k, n_c in zip(row, n_cs)
+                ]
+                scores.append(max(logs) - min(logs))
+            return scores
+
+        # Compare the events with the feature in each class, i.e., documents
+        # in binary mode and tokens otherwise, to those expected if the
+        # feature did not depend on the class
+        totals = self.n_docs if self.binary else self.n_tokens
+        n = sum(totals)
+        mi = self.selection == "mi"
+        scores = []
+        for row in zip(*self.n_w):
+            n_1 = sum(row)
+            score = 0.0
+            for n_1c, n_c in zip(row, totals):
+                for n_ec, n_e in ((n_1c, n_1), (n_c - n_1c, n - n_1)):
+                    expected = n_e * n_c / n
+                    if mi:
+                        if n_ec > 0:
+                            score += n_ec / n * math.log(n_ec / expected)
+                    elif expected > 0:
+                        score += (n_ec - expected) ** 2 / expected
+            scores.append(score)
+        return scores
+
+    def _prune(self, max_features: int) -> None:
+        """Drop the counts of all but the max_features best features.
+
+        Features which the cutoffs leave out rank below all others.
+        """
+        if self.hashing or self.vocabulary is None:
+            return
+        if max_features is None or len(self.vocabulary) <= max_features:
+            return
+
+        scores = self._feature_scores()
+        cut = set(self._cut())
+        ranked = sorted(range(len(scores)), key=lambda i: (i in cut, -scores[i]))
+        self._keep(sorted(ranked[:max_features]))
+
+    def _keep(self, keep: list) -> None:
+        """Drop the counts of all features but those with the sorted ids keep."""
+        words = self.vocabulary.words
+        self.vocabulary = Vocabulary(words[i] for i in keep)
+        self._n_w = [array("d", (counts[i] for i in keep)) for counts in self._n_w]
+        if self.n_df is not None:
+            self.n_df = array("d", (self.n_df[i] for i in keep))
+        self._params = None
+
+    def prune(
+        self, max_features: int = None, selection: str = None
+    ) -> NaiveBayesClassifier:
+        """Keep only the best features of a fitted classifier.
+
+        The counts of the features which the cutoffs leave out are dropped,
+        and then those of all but the max_features best.
+
+        Parameters
+        ----------
+        max_features : int, optional
+            Number of features to keep, which also bounds later updates, by
+            default None, which keeps the classifier's.
+        selection : str, optional
+            How to rank the features, see the attribute, by default None,
+            which keeps the classifier's.
+
+        Returns
+        -------
+        NaiveBayesClassifier
+            The pruned classifier.
+
+        Raises
+        ------
+        ValueError
+            If selection is unknown.
+        """
+        if selection is not None:
+            if selection not in SELECTIONS:
+                raise ValueError(
+                    f"selection must be one of {', '.join(SELECTIONS)}, but got "
+                    f"{selection}."
+                )
+            self.selection = selection
+        if max_features is not None:
+            self.max_features = max_features
+        if not self.hashing and self.vocabulary is not None:
+            cut = set(self._cut())
+            if cut:
+                self._keep([i for i in range(len(self.vocabulary)) if i not in cut])
+        self._prune(self.max_features)
+        return self
+
+    def _reset(self) -> None:
+        """Forget every count."""
+        if self.hashing:
+            self.vocabulary = FeatureHasher(self.n_features)
+        else:
+            self.vocabulary = Vocabulary()
+        if self.ngram_range != (1, 1) and not self.hashing:
+            self.token_vocabulary = Vocabulary()
+        self._classes = []
+        self._n_docs = array("d")
+        self._n_tokens = array("d")
+        self._n_w = []
+        self.n_df = None
+        if not self.binary and (self.min_df > 1 or self.max_df < 1):
+            self.n_df = array("d")
+        self._params = None
+
+    def _add_classes(self, labels) -> None:
+        """Add a class for each label which is not one yet."""
+        new = [label for label in dict.fromkeys(labels) if label not in self._classes]
+        if not new:
+            return
+        try:
+            new.sort()
+        except TypeError:
+            # Labels which cannot be compared keep their order of first appearance
+            pass
+        n_words = len(self._n_w[0]) if self._n_w else 0
+        for label in new:
+            self._classes.append(label)
+            self._n_docs.append(0.0)
+            self._n_tokens.append(0.0)
+            self._n_w.append(array("d", bytes(8 * n_words)))
+        if self._classes == [1, 0]:
+            # Labels 0 and 1 are the negative and the positive class
+            for values in (self._classes, self._n_docs, self._n_tokens, self._n_w):
+                values.reverse()
+        self._params = None
+
+    def _add_counts(self, ids: list, counts: list, df: array = None) -> None:
+        """Add word counts whose j-th entry belongs to the word id ids[j].
+
+        counts holds the counts of each class, or None for classes without any,
+        and df the document frequencies if n_df is kept.
+        """
+        if not self._n_w:
+            return
+        grow = bytes(8 * (len(self.vocabulary) - len(self._n_w[0])))
+        if self.n_df is not None:
+            if not isinstance(self.n_df, array):
+                self.n_df = array("d", self.n_df)
+            self.n_df.frombytes(grow)
+            for i, n in zip(ids, df):
+                if i is not None and n:
+                    self.n_df[i] += n
+        for c, (n_w, n_k) in enumerate(zip(self._n_w, counts)):
+            if not isinstance(n_w, array):
+                # Copy the read-only counts of a loaded model before changing them
+                n_w = self._n_w[c] = array("d", n_w)
+            n_w.frombytes(grow)
+            if n_k is None:
+                continue
+            for i, n in zip(ids, n_k):
+                if i is not None and n:
+                    n_w[i] += n
+            self._n_tokens[c] += sum(n_k)
+        self._params = None
 
     def fit(self, x: list, y: list) -> NaiveBayesClassifier:
         """Fit the classifier on training data.
@@ -134,34 +1218,509 @@ class NaiveBayesClassifier:
         NaiveBayesClassifier
             The fitted classifier.
         """
-        # Determine the probabilities of each class occurring from distribution
-        class_dist = Counter(y)
-        self.p_neg = class_dist[0] / len(y)
-        self.p_pos = class_dist[1] / len(y)
+        self._reset()
+        return self.partial_fit(x, y)
+
+    def partial_fit(self, x: list, y: list) -> NaiveBayesClassifier:
+        """Update the classifier with more training data.
+
+        Parameters
+        ----------
+        x : list[str]
+            A list of textual documents. Documents will undergo sanitization
+            before learning commences.
+        y : list[int]
+            A corresponding list of labels, one for each document.
+
+        Returns
+        -------
+        NaiveBayesClassifier
+            The updated classifier.
+        """
+        if self.vocabulary is None:
+            self._reset()
+
+        for x_chunk, y_chunk in zip(
+            batched(x, FIT_CHUNK_SIZE), batched(y, FIT_CHUNK_SIZE)
+        ):
+            # Extend the vocabulary with the new features so that the documents
+            # can be counted directly in the columns of the classifier
+            tokens = self._tokenize(x_chunk, add=True)
+            if not self.hashing:
+                add = self.vocabulary.add
+                for t in tokens:
+                    for word in t:
+                        add(word)
+            X = CSRMatrix.from_documents(tokens, self.vocabulary, self.binary)
+            self._count(X, y_chunk, self.vocabulary)
+
+            if self.max_features is not None:
+                if len(self.vocabulary) > 2 * self.max_features:
+                    self._prune(self.max_features)
+        self._prune(self.max_features)
+
+        return self
+
+    def fit_matrix(
+        self,
+        X: CSRMatrix,
+        y: list,
+        vocabulary: Vocabulary,
+        sample_weight: list = None,
+    ) -> NaiveBayesClassifier:
+        """Fit the classifier on a document-term count matrix.
+
+        Parameters
+        ----------
+        X : CSRMatrix
+            Counts of each word in each document, one row per document. In
+            binary mode, counts are clipped to 1.
+        y : list[int]
+            A corresponding list of labels, one for each row.
+        vocabulary : Vocabulary
+            The word of each column. Words which do not occur in the weighted
+            rows of X are left out of the fitted vocabulary.
+        sample_weight : list[float], optional
+            A corresponding list of weights, one for each row, by default None,
+            which weighs every row by 1. A row with weight k counts as if its
+            document appeared k times in the training data.
+
+        Returns
+        -------
+        NaiveBayesClassifier
+            The fitted classifier.
+        """
+        self._reset()
+        return self.partial_fit_matrix(X, y, vocabulary, sample_weight)
+
+    def partial_fit_matrix(
+        self,
+        X: CSRMatrix,
+        y: list,
+        vocabulary: Vocabulary,
+        sample_weight: list = None,
+    ) -> NaiveBayesClassifier:
+        """Update the classifier with more training data as a count matrix.
+
+        Parameters
+        ----------
+        X : CSRMatrix
+            Counts of each word in each document, one row per document. In
+            binary mode, counts are clipped to 1.
+        y : list[int]
+            A corresponding list of labels, one for each row.
+        vocabulary : Vocabulary
+            The word of each column.
+        sample_weight : list[float], optional
+            A corresponding list of weights, one for each row, by default None,
+            which weighs every row by 1.
+
+        Returns
+        -------
+        NaiveBayesClassifier
+            The updated classifier.
+
+        Raises
+        ------
+        ValueError
+            If the classifier uses n-grams longer than one and vocabulary is
+            not its own, whose features are the columns of X.
+        """
+        if self.vocabulary is None:
+            self._reset()
+        if self.ngram_range != (1, 1) and vocabulary is not self.vocabulary:
+            raise ValueError("The columns of X must be the n-grams of the classifier.")
+
+        self._count(X, y, vocabulary, sample_weight)
+        self._prune(self.max_features)
+
+        return self
+
+    def _count(
+        self,
+        X: CSRMatrix,
+        y: list,
+        vocabulary: Vocabulary,
+        sample_weight: list = None,
+    ) -> None:
+        """Add the counts of a matrix, see partial_fit_matrix."""
+        # Count the documents of each class and find the rows of each class in
+        # one pass over the labels
+        weights = repeat(1) if sample_weight is None else sample_weight
+        class_dist = Counter()
+        rows = {}
+        for i, (y_i, w_i) in enumerate(zip(y, weights)):
+            class_dist[y_i] += w_i
+            if w_i:
+                rows.setdefault(y_i, []).append(i)
+        self._add_classes(class_dist)
+        for c, label in enumerate(self._classes):
+            self._n_docs[c] += class_dist[label]
 
-        # Preprocess the training text
-        x = [sanitize(x_i, self.binary) for x_i in x]
+        df = None
+        if self.n_df is not None:
+            df = X.binarize().column_sums(None, sample_weight)
 
-        # Extract the vocabulary
-        vocab = set([word for x_i in x for word in x_i.split()])
-        n_v = len(vocab)
+        # The counts of each word for each class are (weighted) column sums
+        # over the rows of the class
+        if self.binary:
+            X = X.binarize()
+        counts = []
+        for label in self._classes:
+            if label not in rows:
+                counts.append(None)
+            elif sample_weight is None:
+                counts.append(X.column_sums(rows[label]))
+            else:
+                weights = [sample_weight[i] for i in rows[label]]
+                counts.append(X.column_sums(rows[label], weights))
 
-        # Extract the vocabulary and counts for the negative class
-        x_neg = [x_i for x_i, y_i in zip(x, y) if y_i == 0]
-        counter_neg = Counter([word for x_i in x_neg for word in x_i.split()])
-        n_n = len(counter_neg)
+        # Extend the vocabulary with the words which occur in X
+        if vocabulary is self.vocabulary:
+            ids = range(X.n_cols)
+        else:
+            add = self.vocabulary.add
+            present = [n_k for n_k in counts if n_k is not None]
+            ids = [
+                add(w) if any(row) else None
+                for w, row in zip(vocabulary.words, zip(*present))
+            ]
+        self._add_counts(ids, counts, df)
 
-        # Extract the vocabulary and counts for the positive class
-        x_pos = [x_i for x_i, y_i in zip(x, y) if y_i == 1]
-        counter_pos = Counter([word for x_i in x_pos for word in x_i.split()])
-        n_p = len(counter_pos)
+    def merge(self, other: NaiveBayesClassifier) -> NaiveBayesClassifier:
+        """Add the counts of a classifier trained on other data.
+
+        Parameters
+        ----------
+        other : NaiveBayesClassifier
+            A classifier in the same mode, e.g., trained on another shard of
+            the data.
+
+        Returns
+        -------
+        NaiveBayesClassifier
+            The merged classifier, which is as if it had been trained on the
+            data of both classifiers.
+
+        Raises
+        ------
+        ValueError
+            If the classifiers are not in the same mode.
+        ValueError
+            If the classifiers use different n-grams.
+        ValueError
+            If other hashes words, but self does not or has a different number
+            of buckets.
+        ValueError
+            If only one of the classifiers keeps document frequencies.
+        """
+        if other.binary != self.binary:
+            raise ValueError("Cannot merge a binary and a count classifier.")
+        if other.ngram_range != self.ngram_range:
+            raise ValueError(
+                f"Cannot merge a classifier of {other.ngram_range} n-grams into "
+                f"one of {self.ngram_range} n-grams."
+            )
+        if other.hashing and (not self.hashing or other.n_features != self.n_features):
+            raise ValueError(
+                "Cannot merge a hashing classifier into one without the same "
+                "number of buckets."
+            )
+        if self.vocabulary is None:
+            self._reset()
+        if other.vocabulary is None:
+            return self
+        if (self.n_df is None) != (other.n_df is None):
+            raise ValueError(
+                "Cannot merge classifiers of which only one counts the documents "
+                "of each feature."
+            )
 
-        # Determine the probability of a word given each class
-        self.p_w_neg = {w: p_w_cls(counter_neg[w], self.delta, n_n, n_v) for w in vocab}
-        self.p_w_pos = {w: p_w_cls(counter_pos[w], self.delta, n_p, n_v) for w in vocab}
+        if other.hashing:
+            # The buckets line up, so the counts are summed
+            ids = range(self.n_features)
+        else:
+            # n-grams are packed with the token ids of each classifier
+            add = self.vocabulary.add
+            ids = [add(self._key(other._name(w))) for w in other.vocabulary.words]
+        # The classes of other are lined up with those of self by their labels
+        self._add_classes(other._classes)
+        columns = dict(zip(other._classes, other._n_w))
+        self._add_counts(
+            ids, [columns.get(label) for label in self._classes], other.n_df
+        )
+        for label, n_docs in zip(other._classes, other._n_docs):
+            self._n_docs[self._classes.index(label)] += n_docs
+        self._prune(self.max_features)
 
         return self
 
+    def decision_function(self, x: list) -> list:
+        """Compute the scores of the classes for novel testing data.
+
+        Parameters
+        ----------
+        x : list[str]
+            A list of textual documents. Documents will undergo sanitization
+            before scoring.
+
+        Returns
+        -------
+        list[float] | list[list[float]]
+            A corresponding list of scores, one for each document. With two
+            classes, each score is the log odds of the positive class, so
+            positive scores favor the positive class. Otherwise each score is
+            the list of the joint log likelihoods of the document and each
+            class, in the order of classes.
+
+        Raises
+        ------
+        ValueError
+            If the classifier was not fitted prior to calling decision_function.
+        """
+        if self.log_prior is None:
+            raise ValueError("The classifier has not been fitted yet.")
+
+        tokens = self._tokenize(x)
+
+        if self.backend == "sparse":
+            X = CSRMatrix.from_documents(tokens, self.vocabulary)
+            return self.decision_function_matrix(X)
+
+        ids = self._ids(tokens)
+        if len(self.classes) == 2:
+            log_ratio = self.log_ratio
+            bias = self.log_prior[1] - self.log_prior[0]
+            return [bias + sum(map(log_ratio.__getitem__, t)) for t in ids]
+
+        # Add the row of each word to the scores of all classes at once
+        k = len(self.classes)
+        log_p_w = self.log_p_w
+        log_prior = list(self.log_prior)
+        scores = []
+        for t in ids:
+            s = log_prior
+            for i in t:
+                s = list(map(add, s, log_p_w[i * k : (i + 1) * k]))
+            scores.append(s)
+        return scores
+
+    def _ids(self, tokens: list) -> list:
+        """Return the word ids of tokenized documents, leaving out unknown words.
+
+        In binary mode, distinct words which hash to the same bucket are one
+        feature, which is counted once per document as in training.
+        """
+        if self.hashing:
+            bucket = self.vocabulary.add
+            if self.binary:
+                return [list(dict.fromkeys(map(bucket, t))) for t in tokens]
+            return [[bucket(w) for w in t] for t in tokens]
+        get = self.vocabulary.ids.get
+        return [[i for i in map(get, t) if i is not None] for t in tokens]
+
+    def decision_function_grid(self, x: list, deltas: list) -> list:
+        """Compute the scores of the classes for each of several values of delta.
+
+        The probabilities are not derived for each delta. Smoothing changes
+        the log probability of a word given a class only through the count of
+        the word in the class, and few distinct counts occur. So each document
+        is summarized once by how often it contains words of each count, and
+        the scores for one delta are then a single product of that summary
+        with the log of each count plus delta.
+
+        Parameters
+        ----------
+        x : list[str]
+            A list of textual documents. Documents will undergo sanitization
+            before scoring.
+        deltas : list[float]
+            Positive values of the smoothing parameter.
+
+        Returns
+        -------
+        list[list[float] | list[list[float]]]
+            The scores for each delta, as returned by decision_function with
+            the classifier's delta set to it. They may differ from those in
+            rounding only.
+
+        Raises
+        ------
+        ValueError
+            If the classifier was not fitted prior to calling this method.
+        """
+        if self.log_prior is None:
+            raise ValueError("The classifier has not been fitted yet.")
+
+        kept, nonzeros = self._smoothing()
+        n_v = len(kept)
+        n_cs = [len(seen) for seen in nonzeros]
+        ids = self._ids(self._tokenize(x))
+        if n_v < len(self.vocabulary):
+            # Features which are not kept contribute nothing, see _parameters
+            kept = set(kept)
+            ids = [[i for i in t if i in kept] for t in ids]
+
+        # Map the counts of the words in x to columns of the summaries, with
+        # one more column for the number of words, which the denominator of
+        # the probabilities is raised to
+        columns = {}
+        for counts in self.n_w:
+            for t in ids:
+                for i in t:
+                    columns.setdefault(counts[i], len(columns))
+        width = len(columns) + 1
+
+        # With two classes, the log odds are scored with one summary whose
+        # second block of columns belongs to the subtracted negative class
+        k = len(self.classes)
+        groups = [(1, 0)] if k == 2 else [(c,) for c in range(k)]
+        summaries = []
+        for group in groups:
+            blocks = [(b * width, self.n_w[c]) for b, c in enumerate(group)]
+            summaries.append(
+                CSRMatrix.from_ids(
+                    (
+                        [o + columns[counts[i]] for o, counts in blocks for i in t]
+                        + [o + width - 1 for o, _ in blocks] * len(t)
+                        for t in ids
+                    ),
+                    width * len(group),
+                )
+            )
+
+        log_prior = self.log_prior
+        grid = []
+        for delta in deltas:
+            log_counts = [math.log(n_k + delta) for n_k in columns]
+            scores = []
+            for group, summary in zip(groups, summaries):
+                weights = array("d")
+                bias = 0.0
+                for sign, c in zip((1, -1), group):
+                    weights.extend(sign * v for v in log_counts)
+                    weights.append(-sign * math.log(n_cs[c] + delta * n_v))
+                    bias += sign * log_prior[c]
+                scores.append([bias + s for s in summary.dot(weights)])
+            grid.append(scores[0] if k == 2 else [list(s) for s in zip(*scores)])
+        return grid
+
+    def predict_grid(self, x: list, deltas: list) -> list:
+        """Predict the class membership for each of several values of delta.
+
+        See decision_function_grid.
+
+        Parameters
+        ----------
+        x : list[str]
+            A list of textual documents. Documents will undergo sanitization
+            before scoring.
+        deltas : list[float]
+            Positive values of the smoothing parameter.
+
+        Returns
+        -------
+        list[list]
+            The prediction labels for each delta, one for each document.
+
+        Raises
+        ------
+        ValueError
+            If the classifier was not fitted prior to calling this method.
+        """
+        return [self._labels(s) for s in self.decision_function_grid(x, deltas)]
+
+    def decision_function_matrix(
+        self, X: CSRMatrix, vocabulary: Vocabulary = None
+    ) -> list:
+        """Compute the scores of the classes for a count matrix.
+
+        Parameters
+        ----------
+        X : CSRMatrix
+            Counts of each word in each document, one row per document.
+        vocabulary : Vocabulary, optional
+            The word of each column, by default None, which means the columns
+            are the ids of the fitted vocabulary.
+
+        Returns
+        -------
+        list[float] | list[list[float]]
+            A corresponding list of scores, one for each row, as returned by
+            decision_function.
+
+        Raises
+        ------
+        ValueError
+            If the classifier was not fitted prior to calling this method.
+        ValueError
+            If the classifier uses n-grams longer than one and vocabulary is
+            given.
+        """
+        if self.log_prior is None:
+            raise ValueError("The classifier has not been fitted yet.")
+
+        k = len(self.classes)
+        weights = self.log_ratio if k == 2 else self.log_p_w
+        width = 1 if k == 2 else k
+        if vocabulary is not None and vocabulary is not self.vocabulary:
+            if self.ngram_range != (1, 1):
+                raise ValueError(
+                    "The columns of X must be the n-grams of the classifier."
+                )
+            # Line the rows of the word weights up with the columns of X
+            if self.hashing:
+                bucket = self.vocabulary.add
+                rows = [bucket(w) for w in vocabulary.words]
+            else:
+                get = self.vocabulary.ids.get
+                rows = [get(w) for w in vocabulary.words]
+            zeros = array("d", bytes(8 * width))
+            aligned = array("d")
+            for i in rows:
+                if i is None:
+                    aligned.extend(zeros)
+                else:
+                    aligned.extend(weights[i * width : (i + 1) * width])
+            weights = aligned
+        if self.binary:
+            X = X.binarize()
+
+        if k == 2:
+            bias = self.log_prior[1] - self.log_prior[0]
+            return [bias + s for s in X.dot(weights)]
+        log_prior = self.log_prior
+        return [list(map(add, log_prior, s)) for s in X.dot_rows(weights, k)]
+
+    def _labels(self, scores: list) -> list:
+        """Return the label of the class each score favors."""
+        classes = self.classes
+        if len(classes) == 2:
+            neg, pos = classes
+            return [pos if d > 0 else neg for d in scores]
+        return [classes[s.index(max(s))] for s in scores]
+
+    def predict_log_proba(self, x: list) -> list:
+        """Compute the log probability of each class for novel testing data.
+
+        Parameters
+        ----------
+        x : list[str]
+            A list of textual documents. Documents will undergo sanitization
+            before scoring.
+
+        Returns
+        -------
+        list[tuple[float, ...]]
+            A corresponding list of the log probabilities of the classes, in
+            the order of classes, one tuple for each document. With two
+            classes, these are the negative and the positive class.
+        """
+        scores = self.decision_function(x)
+        if len(self.classes) == 2:
+            return [(-softplus(d), -softplus(-d)) for d in scores]
+        return [tuple(log_softmax(s)) for s in scores]
+
     def predict(self, x: list) -> list:
         """Predict the class membership for novel testing data.
 
@@ -181,25 +1740,71 @@ class NaiveBayesClassifier:
         ValueError
             If the classifier was not fitted prior to calling predict.
         """
-        if any(x is None for x in (self.p_neg, self.p_pos, self.p_w_neg, self.p_w_pos)):
-            raise ValueError("The classifier has not been fitted yet.")
+        return self._labels(self.decision_function(x))
 
-        x = [sanitize(x_i, self.binary) for x_i in x]
+    def decision_function_iter(self, x, chunk_size: int = 1000):
+        """Lazily compute the scores of the classes for documents.
 
-        y_hat = []
-        for x_i in x:
+        Parameters
+        ----------
+        x : Iterable[str]
+            Textual documents, e.g., the lines of a file, which are read
+            chunk_size at a time.
+        chunk_size : int, optional
+            Number of documents scored at once, by default 1000.
 
-            neg = math.log2(self.p_neg) + sum(
-                math.log2(self.p_w_neg[word])
-                for word in x_i.split()
-                if word in self.p_w_neg
-            )
-            pos = math.log2(self.p_neg) + sum(
-                math.log2(self.p_w_pos[word])
-                for word in x_i.split()
-                if word in self.p_w_pos
-            )
+        Yields
+        ------
+        float | list[float]
+            The score of each document, in order, as returned by
+            decision_function.
 
-            y_hat.append(1 if pos > neg else 0)
+        Raises
+        ------
+        ValueError
+            If the classifier was not fitted prior to scoring.
+        """
+        for chunk in batched(x, chunk_size):
+            yield from self.decision_function(chunk)
+
+    def predict_iter(self, x, chunk_size: int = 1000):
+        """Lazily predict the class membership for documents.
+
+        Parameters
+        ----------
+        x : Iterable[str]
+            Textual documents, e.g., the lines of a file, which are read
+            chunk_size at a time.
+        chunk_size : int, optional
+            Number of documents scored at once, by default 1000.
+
+        Yields
+        ------
+        Any
+            The prediction label of each document, in order.
 
-        return y_hat
+        Raises
+        ------
+        ValueError
+            If the classifier was not fitted prior to scoring.
+        """
+        for chunk in batched(x, chunk_size):
+            yield from self.predict(chunk)
+
+    def predict_matrix(self, X: CSRMatrix, vocabulary: Vocabulary = None) -> list:
+        """Predict the class membership for a count matrix.
+
+        Parameters
+        ----------
+        X : CSRMatrix
+            Counts of each word in each document, one row per document.
+        vocabulary : Vocabulary, optional
+            The word of each column, by default None, which means the columns
+            are the ids of the fitted vocabulary.
+
+        Returns
+        -------
+        list
+            A corresponding list of prediction labels, one for each row.
+        """
+        return self._labels(self.decision_function_matrix(X, vocabulary))
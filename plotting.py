@@ -9,6 +9,9 @@ This software expects the following columns in the input_file .csv file:
     typeA - a symbol indicating the type of the first system, e.g., "c"
     typeB - a symbol indicating the type of the second system, e.g., "b"
 
+Any other columns, such as the indices of the systems (systemA and systemB)
+written by main.py, are ignored.
+
 This slightly contradicts that specifications under D3, but it is convenient.
 """
 
@@ -1,17 +1,72 @@
 """Partition the training data into train and test sets.
+
+The data is streamed in a single sequential read, and the train and test sets
+are written through buffered files as lines are assigned, so files larger
+than memory can be split.
 """
 
 from argparse import ArgumentParser
+from hashlib import blake2b
 from pathlib import Path
-import random
 
+from corpus import load_corpus
+from utils import get_rng
 
 # The number of examples to allocate to the test set
 test_size = 400
 
+# Bytes buffered by each output file
+buffer_size = 2**20
+
+
+def read_lines(data):
+    """Yield the lines of a binary file, adding a newline to the last if needed.
+
+    Lines are written in another order than they are read, so a last line
+    without a newline would run into the next one.
+    """
+    for line in data:
+        if not line.endswith(b"\n"):
+            line += b"\n"
+        yield line
+
+
+def label_of(line: bytes) -> bytes:
+    """Return the label of a line, i.e., its last tab-separated field."""
+    return line.rstrip(b"\r\n").rpartition(b"\t")[2]
 
-def create_train_test_split(data_file: str, train_file: str, test_file: str) -> None:
-    """Create the train and test sets.
+
+def allocate(total: int, counts: dict) -> dict:
+    """Split a total among keys in proportion to their counts.
+
+    The shares are rounded down and the remainder goes to the keys with the
+    largest fractional parts, so the shares add up to the total.
+    """
+    n = sum(counts.values())
+    exact = {key: total * c / n for key, c in counts.items()}
+    shares = {key: int(e) for key, e in exact.items()}
+    remainder = total - sum(shares.values())
+    for key in sorted(exact, key=lambda key: shares[key] - exact[key])[:remainder]:
+        shares[key] += 1
+    return shares
+
+
+def create_train_test_split(
+    data_file: str,
+    train_file: str,
+    test_file: str,
+    cache_dir: str = None,
+    test_size: float = test_size,
+    seed=None,
+    stratify: bool = False,
+) -> None:
+    """Create the train and test sets in one pass over the data.
+
+    The data file is read line by line and both sets are written as they are
+    assigned, so memory does not depend on the size of the data. With a number
+    of test lines, they are drawn by reservoir sampling, which holds that many
+    lines, or that many per label with stratify. With a fraction, each line is
+    assigned on its own.
 
     Parameters
     ----------
@@ -21,6 +76,23 @@ def create_train_test_split(data_file: str, train_file: str, test_file: str) ->
         Unix-style path to the trainMaster.txt file.
     test_file : str
         Unix-style path to the testMaster.txt file.
+    cache_dir : str, optional
+        Directory in which to cache the tokenized train and test sets, by
+            default None, which skips caching.
+    test_size : int | float, optional
+        The number of lines in the test set, or the fraction of the lines if
+            it is a float below 1, by default 400.
+    seed : int | random.Random | None, optional
+        Seed for the assignment, by default None.
+    stratify : bool, optional
+        If true, every label, i.e., the last tab-separated field of a line, has
+            the same share of its lines in the test set, up to rounding, by
+            default False.
+
+    Raises
+    ------
+    ValueError
+        If test_size is more lines than the data file has.
     """
     train_file: Path = Path(train_file)
     test_file: Path = Path(test_file)
@@ -31,19 +103,84 @@ def create_train_test_split(data_file: str, train_file: str, test_file: str) ->
     train_file.parent.mkdir(parents=True, exist_ok=True)
     test_file.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(data_file, "r") as f:
-        lines = f.readlines()
-
-    test_idx = set(random.sample(range(len(lines)), test_size))
-    train_idx = set(range(len(lines))).difference(test_idx)
-
-    test_lines = [l for i, l in enumerate(lines) if i in test_idx]
-    train_lines = [l for i, l in enumerate(lines) if i in train_idx]
-
-    with open(train_file, "w") as f:
-        f.writelines(train_lines)
-    with open(test_file, "w") as f:
-        f.writelines(test_lines)
+    rng = get_rng(seed)
+    with open(data_file, "rb", buffering=buffer_size) as data, open(
+        train_file, "wb", buffering=buffer_size
+    ) as train, open(test_file, "wb", buffering=buffer_size) as test:
+        if isinstance(test_size, float) and test_size < 1:
+            if stratify:
+                _split_systematic(data, train, test, test_size, rng)
+            else:
+                _split_hashed(data, train, test, test_size, rng)
+        else:
+            _split_reservoir(data, train, test, int(test_size), rng, stratify)
+
+    if cache_dir is not None:
+        load_corpus(train_file, cache_dir)
+        load_corpus(test_file, cache_dir)
+
+
+def _split_reservoir(data, train, test, k: int, rng, stratify: bool) -> None:
+    """Draw k test lines uniformly, or uniformly within each label."""
+    # Each reservoir is a uniform sample of k lines of its label, and lines
+    # which leave or never enter it are written to the train set right away
+    reservoirs = {}
+    counts = {}
+    for line in read_lines(data):
+        label = label_of(line) if stratify else b""
+        reservoir = reservoirs.setdefault(label, [])
+        i = counts.get(label, 0)
+        counts[label] = i + 1
+        if i < k:
+            reservoir.append(line)
+            continue
+        j = rng.randrange(i + 1)
+        if j < k:
+            line, reservoir[j] = reservoir[j], line
+        train.write(line)
+
+    if sum(counts.values()) < k:
+        raise ValueError(
+            f"test_size is {k}, but the data has only {sum(counts.values())} lines."
+        )
+    shares = allocate(k, counts)
+    for label, reservoir in reservoirs.items():
+        rng.shuffle(reservoir)
+        test.writelines(reservoir[: shares[label]])
+        train.writelines(reservoir[shares[label] :])
+
+
+def _split_hashed(data, train, test, fraction: float, rng) -> None:
+    """Assign each line to the test set with probability fraction."""
+    # The assignment depends only on the seed and the text of a line, so
+    # duplicate lines end up in the same set
+    key = rng.getrandbits(64).to_bytes(8, "little")
+    threshold = int(fraction * 2**64)
+    for line in read_lines(data):
+        digest = blake2b(line, digest_size=8, key=key).digest()
+        if int.from_bytes(digest, "little") < threshold:
+            test.write(line)
+        else:
+            train.write(line)
+
+
+def _split_systematic(data, train, test, fraction: float, rng) -> None:
+    """Assign a fraction of the lines of each label to the test set."""
+    # The i-th line of a label is a test line if the multiples of fraction,
+    # shifted by a random start for the label, pass an integer at it
+    starts = {}
+    counts = {}
+    for line in read_lines(data):
+        label = label_of(line)
+        start = starts.get(label)
+        if start is None:
+            start = starts[label] = rng.random()
+        i = counts.get(label, 0)
+        counts[label] = i + 1
+        if int((i + 1) * fraction + start) > int(i * fraction + start):
+            test.write(line)
+        else:
+            train.write(line)
 
 
 if __name__ == "__main__":
@@ -67,7 +204,41 @@ if __name__ == "__main__":
         default="testMaster.txt",
         help="Unix-style path to the testMaster.txt file.",
     )
+    parser.add_argument(
+        "--cache-dir",
+        action="store",
+        default=None,
+        help="Directory in which to cache the tokenized train and test sets.",
+    )
+    parser.add_argument(
+        "--test-size",
+        action="store",
+        type=lambda v: float(v) if "." in v else int(v),
+        default=test_size,
+        help="Number of lines in the test set, or the fraction of the lines "
+        "if it contains a decimal point, e.g., 0.1.",
+    )
+    parser.add_argument(
+        "--seed",
+        action="store",
+        type=int,
+        default=None,
+        help="Seed for assigning the lines.",
+    )
+    parser.add_argument(
+        "--stratify",
+        action="store_true",
+        help="Give every label the same share of its lines in the test set.",
+    )
 
     args = parser.parse_args()
 
-    create_train_test_split(args.data_file, args.train_file, args.test_file)
+    create_train_test_split(
+        args.data_file,
+        args.train_file,
+        args.test_file,
+        args.cache_dir,
+        args.test_size,
+        args.seed,
+        args.stratify,
+    )
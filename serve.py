@@ -0,0 +1,611 @@
+"""Local scoring service for saved classifiers.
+
+The service loads model files and listens on a Unix domain socket. Clients
+send one JSON request per line and receive one JSON response per line:
+
+    {"id": 7, "text": "I love this movie", "model": "reviews"}
+    {"id": 7, "model": "reviews", "label": 1, "log_proba": [-2.31, -0.10]}
+
+"model" may be left out when one model is loaded, and "id" is echoed so that
+a client may send many requests before reading the responses, which arrive
+in the order they are scored. The log probabilities are in the order of the
+classes of the model, which {"stats": true} reports along with the number of
+requests, batches and errors, the throughput, and the latency percentiles.
+
+Requests for the same model which arrive close together are scored as one
+batch of at most --max-batch documents, which waits at most --max-wait-ms
+for the batch to fill up. Batches are scored in worker threads, or in worker
+processes with --processes, so the event loop keeps accepting requests.
+"""
+
+from __future__ import annotations
+from argparse import ArgumentParser
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import json
+from pathlib import Path
+import signal
+import stat
+import sys
+import time
+
+from naive_bayes import NaiveBayesClassifier
+
+
+# The models of this process, by name
+_models = {}
+
+# Longest request line in bytes
+line_limit = 2**24
+
+
+def _load_models(paths: dict) -> None:
+    """Load model files into this process, e.g., a worker process."""
+    for name, path in paths.items():
+        _models[name] = NaiveBayesClassifier.load(path)
+
+
+def _score(name: str, texts: list) -> list:
+    """Return the label and the log probabilities of the classes of texts."""
+    clf = _models[name]
+    results = []
+    for log_proba in clf.predict_log_proba(texts):
+        best = max(range(len(log_proba)), key=log_proba.__getitem__)
+        results.append((clf.classes[best], list(log_proba)))
+    return results
+
+
+def percentiles(latencies: list) -> dict:
+    """Return the median, 95th and 99th percentile and maximum in ms."""
+    latencies = sorted(latencies)
+    if not latencies:
+        return {}
+    n = len(latencies)
+    return {
+        name: 1000 * latencies[min(int(q * n), n - 1)]
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+    }
+
+
+class Stats:
+    """Counters and recent latencies of a service.
+
+    Attributes
+    ----------
+    requests : int
+        Number of answered requests.
+    errors : int
+        Number of requests answered with an error.
+    batches : int
+        Number of scored batches.
+    documents : int
+        Number of scored documents.
+    latencies : collections.deque[float]
+        Seconds from receiving to answering each of the most recent requests.
+    """
+
+    def __init__(self, window: int = 10_000) -> None:
+        """Start counting.
+
+        Parameters
+        ----------
+        window : int, optional
+            Number of recent latencies kept, by default 10_000.
+        """
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.documents = 0
+        self.latencies = deque(maxlen=window)
+        self._start = time.perf_counter()
+
+    def summary(self) -> dict:
+        """Return the counters, throughput and latency percentiles in ms."""
+        elapsed = time.perf_counter() - self._start
+        return {
+            "seconds": elapsed,
+            "requests": self.requests,
+            "errors": self.errors,
+            "batches": self.batches,
+            "documents": self.documents,
+            "mean_batch": self.documents / self.batches if self.batches else None,
+            "requests_per_second": self.requests / elapsed if elapsed > 0 else None,
+            "latency_ms": percentiles(self.latencies),
+        }
+
+
+class Batcher:
+    """Queue of documents for one model which are scored in micro-batches.
+
+    Attributes
+    ----------
+    name : str
+        Name of the model.
+    max_batch : int
+        Largest number of documents scored at once.
+    max_wait : float
+        Longest time in seconds a batch waits to fill up.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        executor,
+        stats: Stats,
+        max_batch: int = 64,
+        max_wait: float = 0.002,
+    ) -> None:
+        """Create an empty queue.
+
+        Parameters
+        ----------
+        name : str
+            Name of the model.
+        executor : concurrent.futures.Executor
+            Where batches are scored.
+        stats : Stats
+            Counters of the service.
+        max_batch : int, optional
+            Largest number of documents scored at once, by default 64.
+        max_wait : float, optional
+            Longest time in seconds a batch waits to fill up, by default 0.002.
+        """
+        self.name = name
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._executor = executor
+        self._stats = stats
+        self._pending = deque()
+        self._ready = asyncio.Event()
+
+    async def score(self, text: str) -> tuple:
+        """Score one document with the next batch.
+
+        Returns
+        -------
+        tuple[Any, list[float]]
+            The label and the log probability of each class.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        self._ready.set()
+        return await future
+
+    async def run(self) -> None:
+        """Score batches of queued documents until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._pending:
+                self._ready.clear()
+                await self._ready.wait()
+
+            # Wait for more documents until the batch is full or the oldest
+            # document has waited max_wait
+            deadline = loop.time() + self.max_wait
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._ready.clear()
+                try:
+                    await asyncio.wait_for(self._ready.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            # Another runner of this model may have taken every document
+            if not self._pending:
+                continue
+
+            n = min(self.max_batch, len(self._pending))
+            batch = [self._pending.popleft() for _ in range(n)]
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, _score, self.name, [text for text, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self._stats.batches += 1
+            self._stats.documents += n
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class Service:
+    """Scoring service for one or more saved classifiers.
+
+    Attributes
+    ----------
+    paths : dict[str, str]
+        The model file of each model name.
+    stats : Stats
+        Counters of the service.
+
+    Usage
+    -----
+    >>> service = Service({"reviews": "./models/system0.nbm"})
+    >>> asyncio.run(service.serve("./nb.sock"))
+    """
+
+    def __init__(
+        self,
+        paths: dict,
+        max_batch: int = 64,
+        max_wait: float = 0.002,
+        processes: int = 0,
+        threads: int = 1,
+    ) -> None:
+        """Load the models.
+
+        Parameters
+        ----------
+        paths : dict[str, str]
+            The model file of each model name.
+        max_batch : int, optional
+            Largest number of documents scored at once, by default 64.
+        max_wait : float, optional
+            Longest time in seconds a batch waits to fill up, by default 0.002.
+        processes : int, optional
+            Number of worker processes scoring batches, by default 0, which
+            scores them in threads of this process.
+        threads : int, optional
+            Number of worker threads without worker processes, by default 1.
+            Scoring holds the GIL, so more threads mostly help when batches
+            are small.
+
+        Raises
+        ------
+        ValueError
+            If no model is given.
+        """
+        if not paths:
+            raise ValueError("At least one model file is required.")
+        self.paths = dict(paths)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.processes = processes
+        self.threads = threads
+        self.stats = Stats()
+        # Loading memory maps the model files, so every worker process shares
+        # their pages
+        _load_models(self.paths)
+
+    def _executor(self):
+        if self.processes > 0:
+            return ProcessPoolExecutor(
+                self.processes, initializer=_load_models, initargs=(self.paths,)
+            )
+        return ThreadPoolExecutor(self.threads)
+
+    def info(self) -> dict:
+        """Return the statistics and the classes of each model."""
+        return {
+            **self.stats.summary(),
+            "models": {name: _models[name].classes for name in self.paths},
+        }
+
+    async def _answer(self, line: bytes, batchers: dict) -> dict:
+        """Answer one request line."""
+        start = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a JSON object.")
+            request_id = request.get("id")
+            if request.get("stats"):
+                return {"id": request_id, **self.info()}
+            name = request.get("model")
+            if name is None and len(batchers) == 1:
+                name = next(iter(batchers))
+            if name not in batchers:
+                raise ValueError(
+                    f"model must be one of {', '.join(batchers)}, but got {name}."
+                )
+            text = request.get("text")
+            if not isinstance(text, str):
+                raise ValueError("A request must have a text string.")
+            label, log_proba = await batchers[name].score(text)
+            response = {
+                "id": request_id,
+                "model": name,
+                "label": label,
+                "log_proba": log_proba,
+            }
+        except Exception as e:
+            self.stats.errors += 1
+            response = {"id": request_id, "error": str(e)}
+        self.stats.requests += 1
+        self.stats.latencies.append(time.perf_counter() - start)
+        return response
+
+    async def _handle(self, reader, writer, batchers: dict) -> None:
+        """Answer the requests of one connection as they are scored."""
+        tasks = set()
+
+        async def answer(line: bytes) -> None:
+            response = await self._answer(line, batchers)
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # The rest of an overlong line cannot be told apart from
+                    # the next request, so the connection ends after the error
+                    self.stats.requests += 1
+                    self.stats.errors += 1
+                    error = f"A request line is longer than {line_limit} bytes."
+                    writer.write(
+                        json.dumps({"id": None, "error": error}).encode("utf-8")
+                        + b"\n"
+                    )
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if writer.transport.get_write_buffer_size() > 2**20:
+                    await writer.drain()
+            if tasks:
+                await asyncio.wait(tasks)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def serve(self, socket_path: str, stats_every: float = 0) -> None:
+        """Listen on a Unix domain socket until interrupted.
+
+        Parameters
+        ----------
+        socket_path : str
+            Location of the socket. A stale socket file there is replaced.
+        stats_every : float, optional
+            Seconds between statistics written to standard output, by
+            default 0, which only writes them at the end.
+        """
+        path = Path(socket_path)
+        if path.exists() and stat.S_ISSOCK(path.stat().st_mode):
+            path.unlink()
+
+        loop = asyncio.get_running_loop()
+        stopped = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stopped.set)
+
+        with self._executor() as executor:
+            batchers = {
+                name: Batcher(
+                    name, executor, self.stats, self.max_batch, self.max_wait
+                )
+                for name in self.paths
+            }
+            # One batch per worker may be scored at a time
+            workers = max(self.processes, self.threads, 1)
+            runners = [
+                asyncio.ensure_future(batcher.run())
+                for batcher in batchers.values()
+                for _ in range(workers)
+            ]
+            server = await asyncio.start_unix_server(
+                lambda r, w: self._handle(r, w, batchers),
+                str(path),
+                limit=line_limit,
+            )
+            print(f"Serving {', '.join(self.paths)} on {path}", flush=True)
+            try:
+                while not stopped.is_set():
+                    try:
+                        await asyncio.wait_for(stopped.wait(), stats_every or None)
+                    except asyncio.TimeoutError:
+                        print(json.dumps(self.stats.summary()), flush=True)
+            finally:
+                server.close()
+                await server.wait_closed()
+                for runner in runners:
+                    runner.cancel()
+                if path.exists():
+                    path.unlink()
+        print(json.dumps(self.stats.summary()), flush=True)
+
+
+async def load_test(
+    socket_path: str,
+    texts: list,
+    concurrency: int = 32,
+    model: str = None,
+) -> dict:
+    """Score texts through a running service and measure it from the outside.
+
+    Parameters
+    ----------
+    socket_path : str
+        Location of the socket of the service.
+    texts : list[str]
+        Documents to score. Each connection sends its share one request at a
+        time.
+    concurrency : int, optional
+        Number of connections, by default 32.
+    model : str, optional
+        Name of the model, by default None, which is the only one.
+
+    Returns
+    -------
+    dict[str, Any]
+        The number of requests and errors, the throughput, the latency
+        percentiles in ms as seen by the clients, and the statistics of the
+        service.
+    """
+    latencies = []
+    errors = 0
+
+    async def client(share: list) -> None:
+        nonlocal errors
+        reader, writer = await asyncio.open_unix_connection(
+            socket_path, limit=line_limit
+        )
+        try:
+            for i, text in share:
+                request = {"id": i, "text": text}
+                if model is not None:
+                    request["model"] = model
+                start = time.perf_counter()
+                writer.write(json.dumps(request).encode("utf-8") + b"\n")
+                response = json.loads(await reader.readline())
+                latencies.append(time.perf_counter() - start)
+                errors += "error" in response
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    numbered = list(enumerate(texts))
+    await asyncio.gather(
+        *(client(numbered[c::concurrency]) for c in range(concurrency))
+    )
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    writer.write(b'{"stats": true}\n')
+    service = json.loads(await reader.readline())
+    writer.close()
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed > 0 else None,
+        "latency_ms": percentiles(latencies),
+        "service": service,
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Score requests for saved classifiers on a Unix socket."
+    )
+    serve_parser.add_argument(
+        "--model",
+        action="append",
+        required=True,
+        help="A model as <name>=<model_file>, or a Unix-style path to a model "
+        "file which is named after it. May be repeated.",
+    )
+    serve_parser.add_argument(
+        "--socket",
+        action="store",
+        default="./nb.sock",
+        help="Unix-style path to the socket.",
+    )
+    serve_parser.add_argument(
+        "--max-batch",
+        action="store",
+        type=int,
+        default=64,
+        help="Largest number of documents scored at once.",
+    )
+    serve_parser.add_argument(
+        "--max-wait-ms",
+        action="store",
+        type=float,
+        default=2.0,
+        help="Longest time in milliseconds a batch waits to fill up.",
+    )
+    serve_parser.add_argument(
+        "--processes",
+        action="store",
+        type=int,
+        default=0,
+        help="Number of worker processes scoring batches, by default none.",
+    )
+    serve_parser.add_argument(
+        "--threads",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of worker threads scoring batches without processes.",
+    )
+    serve_parser.add_argument(
+        "--stats-every",
+        action="store",
+        type=float,
+        default=0,
+        help="Seconds between statistics written to standard output.",
+    )
+
+    load_parser = subparsers.add_parser(
+        "load-test", help="Score a file through a running service."
+    )
+    load_parser.add_argument(
+        "--input-file",
+        action="store",
+        default="./testMaster.txt",
+        help="Unix-style path to a file with one document per line. A label "
+        "field after a tab is ignored.",
+    )
+    load_parser.add_argument(
+        "--socket",
+        action="store",
+        default="./nb.sock",
+        help="Unix-style path to the socket.",
+    )
+    load_parser.add_argument(
+        "--concurrency",
+        action="store",
+        type=int,
+        default=32,
+        help="Number of concurrent connections.",
+    )
+    load_parser.add_argument(
+        "--repeat",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of times to send the file.",
+    )
+    load_parser.add_argument(
+        "--model",
+        action="store",
+        default=None,
+        help="Name of the model to score with.",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        paths = {}
+        for spec in args.model:
+            name, _, path = spec.rpartition("=")
+            paths[name or Path(path).stem] = path
+        service = Service(
+            paths,
+            args.max_batch,
+            args.max_wait_ms / 1000,
+            args.processes,
+            args.threads,
+        )
+        asyncio.run(service.serve(args.socket, args.stats_every))
+    else:
+        texts = []
+        with open(args.input_file, "r") as f:
+            for line in f:
+                text, sep, label = line.rstrip("\n").rpartition("\t")
+                texts.append(text if sep else label)
+        result = asyncio.run(
+            load_test(args.socket, texts * args.repeat, args.concurrency, args.model)
+        )
+        json.dump(result, sys.stdout, indent=2)
+        print()
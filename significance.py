@@ -0,0 +1,251 @@
+"""Bootstrap significance tests which compare every pair of systems at once.
+
+All systems are scored on the same resamples of the test set (common random
+numbers). A resample is described by how many times it drew each document,
+which is split into bit planes: plane k marks the documents whose count has
+bit k set. Predictions and labels are held as integers with one byte per
+document, so the number of true positives of a system under a resample is
+
+    sum(popcount(tp_mask & plane_k) << k for each plane k)
+
+which costs a handful of big-integer operations instead of a Python loop over
+the documents. This yields an F-score for every system under every resample,
+and every pair's pvalue follows from comparing two rows of that table.
+"""
+
+from itertools import islice
+import math
+
+from metrics import fscore_from_counts, to_mask, weight_planes
+from utils import Sampler, popcount
+
+
+def resample_planes(idx: list, n: int) -> list:
+    """Split the number of times each document was drawn into bit planes.
+
+    Parameters
+    ----------
+    idx : list[int]
+        Indices of the documents drawn by a resample.
+    n : int
+        Number of documents.
+
+    Returns
+    -------
+    list[int]
+        Plane k, packed with one byte per document, marks the documents whose
+        count has bit k set.
+    """
+    counts = [0] * n
+    for i in idx:
+        counts[i] += 1
+    return weight_planes(counts)
+
+
+def resampled_fscores(
+    predictions: list,
+    labels: list,
+    seed=None,
+    beta: float = 1,
+    zero_division: int = 0,
+):
+    """Score every system on the test set, then on one resample after another.
+
+    Parameters
+    ----------
+    predictions : list[bytearray]
+        A systems by documents matrix of 0/1 predictions.
+    labels : list[int]
+        Ground truth 0/1 labels for the documents.
+    seed : int | str | random.Random | None, optional
+        Seed for the resampling, by default None.
+    beta : float, optional
+        Value such that recall is beta-times more weighted than precision,
+            by default 1.
+    zero_division : int, optional
+        Value to return when there are no true positives, by default 0.
+
+    Yields
+    ------
+    list[float]
+        The fscore of each system, first on the test set and then on each
+        resample. The generator never ends.
+    """
+    n = len(labels)
+    y = to_mask(labels)
+    p_masks = [to_mask(p) for p in predictions]
+    tp_masks = [p & y for p in p_masks]
+
+    def scores(planes: list) -> list:
+        pos = sum(popcount(y & plane) << k for k, plane in enumerate(planes))
+        result = []
+        for p, t in zip(p_masks, tp_masks):
+            tp = sum(popcount(t & plane) << k for k, plane in enumerate(planes))
+            pp = sum(popcount(p & plane) << k for k, plane in enumerate(planes))
+            f = fscore_from_counts(tp, pp - tp, pos - tp, beta, zero_division)
+            result.append(f)
+        return result
+
+    yield scores([to_mask([1] * n)])
+
+    sampler = Sampler.uniform(n, seed)
+    while True:
+        yield scores(resample_planes(sampler.sample(n), n))
+
+
+def fscore_table(
+    predictions: list,
+    labels: list,
+    n_resamples: int,
+    seed=None,
+    beta: float = 1,
+    zero_division: int = 0,
+) -> tuple:
+    """Compute the fscore of every system on the test set and its resamples.
+
+    Parameters
+    ----------
+    predictions : list[bytearray]
+        A systems by documents matrix of 0/1 predictions.
+    labels : list[int]
+        Ground truth 0/1 labels for the documents.
+    n_resamples : int
+        Number of resamples of the test set.
+    seed : int | str | random.Random | None, optional
+        Seed for the resampling, by default None.
+    beta : float, optional
+        Value such that recall is beta-times more weighted than precision,
+            by default 1.
+    zero_division : int, optional
+        Value to return when there are no true positives, by default 0.
+
+    Returns
+    -------
+    tuple[list[float], list[list[float]]]
+        The fscore of each system on the test set, and a systems by resamples
+        table of fscores.
+    """
+    scores = resampled_fscores(predictions, labels, seed, beta, zero_division)
+    full = next(scores)
+    columns = list(islice(scores, n_resamples))
+    table = [list(row) for row in zip(*columns)] if columns else [[] for _ in full]
+
+    return full, table
+
+
+def settled(s: int, m: int, alpha: float, z: float = 2.576) -> bool:
+    """Return whether a running pvalue estimate is clearly above or below alpha.
+
+    Parameters
+    ----------
+    s : int
+        Number of resamples counted towards the pvalue.
+    m : int
+        Number of resamples drawn.
+    alpha : float
+        The significance level.
+    z : float, optional
+        Quantile of the standard normal distribution giving the width of the
+        Wilson score interval around s / m, by default 2.576, i.e., 99%.
+
+    Returns
+    -------
+    bool
+        True if alpha lies outside of the interval.
+    """
+    if m == 0:
+        return False
+    p = s / m
+    denominator = 1 + z**2 / m
+    center = (p + z**2 / (2 * m)) / denominator
+    half = z * math.sqrt(p * (1 - p) / m + z**2 / (4 * m**2)) / denominator
+    return center + half < alpha or center - half > alpha
+
+
+def adaptive_pvalues(
+    predictions: list,
+    labels: list,
+    pairs: list,
+    max_resamples: int,
+    alpha: float = 0.05,
+    block: int = 50,
+    seed=None,
+) -> list:
+    """Compute pvalues on shared resamples, stopping each pair once settled.
+
+    Resamples are drawn in blocks. After each block, every pair whose running
+    pvalue is settled (see settled) stops, while the others continue up to
+    max_resamples.
+
+    Parameters
+    ----------
+    predictions : list[bytearray]
+        A systems by documents matrix of 0/1 predictions.
+    labels : list[int]
+        Ground truth 0/1 labels for the documents.
+    pairs : list[tuple[int, int]]
+        The pairs of systems to compare.
+    max_resamples : int
+        Maximum number of resamples of a pair.
+    alpha : float, optional
+        The significance level, by default 0.05.
+    block : int, optional
+        Number of resamples drawn between checks, by default 50.
+    seed : int | str | random.Random | None, optional
+        Seed for the resampling, by default None.
+
+    Returns
+    -------
+    list[tuple[float, float, int]]
+        The pvalue, the effect size and the number of resamples used of each
+        pair.
+    """
+    scores = resampled_fscores(predictions, labels, seed)
+    full = next(scores)
+    deltas = [abs(full[i] - full[j]) for i, j in pairs]
+    s = [0] * len(pairs)
+    m = [0] * len(pairs)
+
+    active = list(range(len(pairs)))
+    drawn = 0
+    while active and drawn < max_resamples:
+        columns = list(islice(scores, min(block, max_resamples - drawn)))
+        drawn += len(columns)
+        still_active = []
+        for k in active:
+            i, j = pairs[k]
+            threshold = 2 * deltas[k]
+            s[k] += sum(1 for f in columns if f[i] - f[j] >= threshold)
+            m[k] = drawn
+            if not settled(s[k], m[k], alpha):
+                still_active.append(k)
+        active = still_active
+
+    return [(s_k / m_k, d, m_k) for s_k, m_k, d in zip(s, m, deltas)]
+
+
+def pairwise_pvalues(full: list, table: list, pairs: list) -> list:
+    """Compute the paired bootstrap pvalue of pairs of systems.
+
+    Parameters
+    ----------
+    full : list[float]
+        The fscore of each system on the test set.
+    table : list[list[float]]
+        A systems by resamples table of fscores.
+    pairs : list[tuple[int, int]]
+        The pairs of systems to compare.
+
+    Returns
+    -------
+    list[tuple[float, float]]
+        The pvalue and the effect size of each pair. The pvalue is the share
+        of resamples on which the first system beats the second by at least
+        twice the effect size.
+    """
+    results = []
+    for i, j in pairs:
+        delta_f = abs(full[i] - full[j])
+        s = sum(1 for f_a, f_b in zip(table[i], table[j]) if f_a - f_b >= 2 * delta_f)
+        results.append((s / len(table[i]), delta_f))
+    return results
@@ -0,0 +1,354 @@
+"""Sparse document-term matrices for bag-of-words models.
+"""
+
+from __future__ import annotations
+from array import array
+from collections import Counter
+from functools import lru_cache
+from itertools import repeat
+from operator import add, mul
+import zlib
+
+
+class Vocabulary:
+    """Mapping between words and contiguous integer ids.
+
+    Attributes
+    ----------
+    ids : dict[str, int]
+        The id of each word.
+    words : list[str]
+        The word of each id.
+
+    Usage
+    -----
+    >>> vocab = Vocabulary.fit([["i", "love", "this"], ["i", "hate", "this"]])
+    >>> len(vocab), vocab.get("hate"), vocab.words[1]
+    ... (4, 3, 'love')
+    """
+
+    def __init__(self, words: list = ()) -> None:
+        """Create a vocabulary.
+
+        Parameters
+        ----------
+        words : list[str], optional
+            Words to add, in id order, by default ().
+        """
+        self.ids = {}
+        self.words = []
+        for word in words:
+            self.add(word)
+
+    @classmethod
+    def fit(cls, documents: list) -> Vocabulary:
+        """Create a vocabulary from tokenized documents.
+
+        Parameters
+        ----------
+        documents : list[list[str]]
+            Tokenized documents. Words are assigned ids in order of first
+            appearance.
+
+        Returns
+        -------
+        Vocabulary
+            The vocabulary.
+        """
+        vocab = cls()
+        for tokens in documents:
+            for word in tokens:
+                vocab.add(word)
+        return vocab
+
+    def add(self, word: str) -> int:
+        """Add a word to the vocabulary if it is not already present.
+
+        Parameters
+        ----------
+        word : str
+            The word.
+
+        Returns
+        -------
+        int
+            The id of the word.
+        """
+        i = self.ids.get(word)
+        if i is None:
+            i = self.ids[word] = len(self.words)
+            self.words.append(word)
+        return i
+
+    def get(self, word: str, default: int = None) -> int:
+        """Return the id of a word, or default if it is not in the vocabulary."""
+        return self.ids.get(word, default)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.ids
+
+    def __getstate__(self) -> list:
+        # The ids are rebuilt from the words, which halves the pickled size
+        return self.words
+
+    def __setstate__(self, words: list) -> None:
+        self.words = words
+        self.ids = {w: i for i, w in enumerate(words)}
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+
+@lru_cache(maxsize=2**16)
+def _crc32(word: str) -> int:
+    """Return the CRC-32 of a word, which is the same in every process."""
+    return zlib.crc32(word.encode("utf-8"))
+
+
+class FeatureHasher:
+    """Mapping of words to a fixed number of buckets by a stable hash.
+
+    No words are stored, so the memory of a model does not grow with the
+    number of distinct words, at the cost of words sharing buckets.
+
+    Attributes
+    ----------
+    n_features : int
+        Number of buckets.
+
+    Usage
+    -----
+    >>> hasher = FeatureHasher(2**10)
+    >>> hasher.add("great"), len(hasher)
+    ... (607, 1024)
+    """
+
+    def __init__(self, n_features: int = 2**20) -> None:
+        """Create a hasher.
+
+        Parameters
+        ----------
+        n_features : int, optional
+            Number of buckets, by default 2**20.
+
+        Raises
+        ------
+        ValueError
+            If n_features is not positive.
+        """
+        if n_features < 1:
+            raise ValueError(f"n_features must be positive, but got {n_features}.")
+        self.n_features = n_features
+
+    def add(self, word: str) -> int:
+        """Return the bucket of a word, as Vocabulary.add returns its id."""
+        return _crc32(word) % self.n_features
+
+    def get(self, word: str, default: int = None) -> int:
+        """Return the bucket of a word. Every word has one."""
+        return _crc32(word) % self.n_features
+
+    def __contains__(self, word: str) -> bool:
+        return True
+
+    def __len__(self) -> int:
+        return self.n_features
+
+
+class CSRMatrix:
+    """Compressed sparse row matrix of document-term counts.
+
+    The counts of row r are data[indptr[r]:indptr[r + 1]] and sit in the
+    columns indices[indptr[r]:indptr[r + 1]].
+
+    Attributes
+    ----------
+    indptr : array.array
+        Offsets of each row into indices and data, one more than the number of
+        rows.
+    indices : array.array
+        Column of each stored count.
+    data : array.array
+        Stored counts.
+    n_cols : int
+        Number of columns.
+    """
+
+    def __init__(
+        self, indptr: array, indices: array, data: array, n_cols: int
+    ) -> None:
+        """Create a matrix from its CSR arrays.
+
+        Parameters
+        ----------
+        indptr : array.array
+            Offsets of each row into indices and data.
+        indices : array.array
+            Column of each stored count.
+        data : array.array
+            Stored counts.
+        n_cols : int
+            Number of columns.
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.n_cols = n_cols
+
+    @classmethod
+    def from_documents(
+        cls, documents: list, vocabulary: Vocabulary, binary: bool = False
+    ) -> CSRMatrix:
+        """Encode tokenized documents as a matrix of counts.
+
+        Parameters
+        ----------
+        documents : list[list[str]]
+            Tokenized documents, one per row.
+        vocabulary : Vocabulary | FeatureHasher
+            Vocabulary giving the column of each word. Words which are not in
+            the vocabulary are ignored.
+        binary : bool, optional
+            If true, counts are clipped to 1, by default False.
+
+        Returns
+        -------
+        CSRMatrix
+            The encoded documents.
+        """
+        if isinstance(vocabulary, FeatureHasher):
+            bucket = vocabulary.add
+            return cls.from_ids(
+                ([bucket(w) for w in tokens] for tokens in documents),
+                len(vocabulary),
+                binary,
+            )
+        ids = vocabulary.ids
+        return cls.from_ids(
+            ([ids[w] for w in tokens if w in ids] for tokens in documents),
+            len(vocabulary),
+            binary,
+        )
+
+    @classmethod
+    def from_ids(
+        cls, documents: list, n_cols: int, binary: bool = False
+    ) -> CSRMatrix:
+        """Encode documents of token ids as a matrix of counts.
+
+        Parameters
+        ----------
+        documents : list[list[int]]
+            Documents as sequences of token ids, one per row.
+        n_cols : int
+            Number of columns, i.e., one more than the largest token id.
+        binary : bool, optional
+            If true, counts are clipped to 1, by default False.
+
+        Returns
+        -------
+        CSRMatrix
+            The encoded documents.
+        """
+        indptr = array("q", [0])
+        indices = array("i")
+        data = array("i")
+        for ids in documents:
+            counts = Counter(ids)
+            indices.extend(counts.keys())
+            if binary:
+                data.extend(1 for _ in counts)
+            else:
+                data.extend(counts.values())
+            indptr.append(len(indices))
+        return cls(indptr, indices, data, n_cols)
+
+    @property
+    def n_rows(self) -> int:
+        """Number of rows."""
+        return len(self.indptr) - 1
+
+    def binarize(self) -> CSRMatrix:
+        """Return a copy of the matrix with every stored count clipped to 1."""
+        return CSRMatrix(
+            self.indptr, self.indices, array("i", [1]) * len(self.data), self.n_cols
+        )
+
+    def column_sums(self, rows: list = None, weights: list = None) -> array:
+        """Sum the counts of each column.
+
+        Parameters
+        ----------
+        rows : list[int], optional
+            Rows to include, by default None, which includes every row.
+        weights : list[float], optional
+            Weight of each included row, by default None, which weighs every
+            row by 1.
+
+        Returns
+        -------
+        array.array
+            The sum of each column, as integers when no weights are given.
+        """
+        sums = array("q" if weights is None else "d", bytes(8 * self.n_cols))
+        indptr, indices, data = self.indptr, self.indices, self.data
+        if rows is None and weights is None:
+            for j, c in zip(indices, data):
+                sums[j] += c
+            return sums
+        if rows is None:
+            rows = range(self.n_rows)
+        if weights is None:
+            weights = repeat(1)
+        for r, w in zip(rows, weights):
+            for k in range(indptr[r], indptr[r + 1]):
+                sums[indices[k]] += w * data[k]
+        return sums
+
+    def dot(self, vector: array) -> list:
+        """Multiply the matrix by a vector with one value per column.
+
+        Parameters
+        ----------
+        vector : array.array | list[float]
+            The vector.
+
+        Returns
+        -------
+        list[float]
+            The product, one value per row.
+        """
+        indptr, indices, data = self.indptr, self.indices, self.data
+        get = vector.__getitem__
+        return [
+            sum(map(mul, data[s:e], map(get, indices[s:e])))
+            for s, e in zip(indptr, indptr[1:])
+        ]
+
+    def dot_rows(self, matrix: array, k: int) -> list:
+        """Multiply the matrix by a matrix with one row of k values per column.
+
+        Parameters
+        ----------
+        matrix : array.array
+            The matrix, stored row by row, so that the row of column j is
+            matrix[j * k : (j + 1) * k].
+        k : int
+            Number of values in each row.
+
+        Returns
+        -------
+        list[list[float]]
+            The product, one list of k values per row.
+        """
+        indptr, indices, data = self.indptr, self.indices, self.data
+        products = []
+        for s, e in zip(indptr, indptr[1:]):
+            row = [0.0] * k
+            for j, c in zip(indices[s:e], data[s:e]):
+                values = matrix[j * k : (j + 1) * k]
+                if c != 1:
+                    values = [c * v for v in values]
+                row = list(map(add, row, values))
+            products.append(row)
+        return products
@@ -1,12 +1,25 @@
 """Create collections randomly selected subsets of the training set.
+
+Each subset is stored as the rows of the training set it selected together with
+how many times each row was drawn. Every subset is written to one binary file,
+laid out as follows with integers in native byte order:
+
+    magic          8 bytes, b"NBSPLT01"
+    header         2 x uint64: number of rows in the training set, number of
+                   subsets
+    per subset     1 x uint64: number of distinct rows n, then n x uint32 row
+                   ids followed by n x uint32 counts
 """
 
 from argparse import ArgumentParser
+from array import array
+from collections import Counter
 from pathlib import Path
 import shutil
+import struct
 
 
-from utils import choices
+from utils import Sampler
 
 
 # The number of examples in each subset
@@ -14,34 +27,109 @@ sizes = (2600, 1300, 650)
 # The number of subsets to create for each size
 n_docs_per_size = 10
 
+# Location of the subsets
+training_sets_path = Path("./trainingSets")
+splits_file = training_sets_path / "splits.bin"
+
+MAGIC = b"NBSPLT01"
+HEADER = struct.Struct("=2Q")
+LENGTH = struct.Struct("=Q")
+
+
+def save_splits(path: str, n_rows: int, splits: list) -> None:
+    """Write subsets of the training set to a binary file.
+
+    Parameters
+    ----------
+    path : str
+        Location of the file.
+    n_rows : int
+        Number of rows in the training set.
+    splits : list[tuple[array.array, array.array]]
+        The row ids and counts of each subset.
+    """
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER.pack(n_rows, len(splits)))
+        for rows, counts in splits:
+            f.write(LENGTH.pack(len(rows)))
+            array("I", rows).tofile(f)
+            array("I", counts).tofile(f)
+
 
-def create_training_splits(train_file: str) -> None:
+def load_splits(path: str) -> tuple:
+    """Read subsets of the training set from a binary file.
+
+    Parameters
+    ----------
+    path : str
+        Location of the file.
+
+    Returns
+    -------
+    tuple[int, list[tuple[array.array, array.array]]]
+        The number of rows in the training set, and the row ids and counts of
+        each subset.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a splits file.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a splits file.")
+        n_rows, n_splits = HEADER.unpack(f.read(HEADER.size))
+        splits = []
+        for _ in range(n_splits):
+            (n,) = LENGTH.unpack(f.read(LENGTH.size))
+            rows, counts = array("I"), array("I")
+            rows.fromfile(f, n)
+            counts.fromfile(f, n)
+            splits.append((rows, counts))
+    return n_rows, splits
+
+
+def create_training_splits(
+    train_file: str, seed=None, write_text: bool = False
+) -> None:
     """Create several subsets of the training set.
 
     Parameters
     ----------
     train_file : str
         Unix-style path to the trainMaster.txt file.
+    seed : int | random.Random | None, optional
+        Seed for selecting the subsets, by default None.
+    write_text : bool, optional
+        If true, also write a copy of the selected lines of each subset to
+            trainingSets/<size>/train<i>.txt, by default False.
     """
-    training_sets_path = Path("./trainingSets")
     shutil.rmtree(training_sets_path, ignore_errors=True)
     training_sets_path.mkdir(parents=True)
 
     with open(train_file, "r") as f:
         lines = f.readlines()
+    sampler = Sampler.uniform(len(lines), seed)
 
+    splits = []
     for size in sizes:
         size_path = training_sets_path / str(size)
-        size_path.mkdir()
+        if write_text:
+            size_path.mkdir()
 
         for i in range(n_docs_per_size):
-            idx = choices(
-                list(range(len(lines))), [1 for i in range(len(lines))], k=size
-            )
-            selected = [lines[i] for i in idx]
+            idx = sampler.sample(size)
+            counts = Counter(idx)
+            rows = sorted(counts)
+            splits.append((rows, [counts[r] for r in rows]))
+
+            if write_text:
+                selected = [lines[i] for i in idx]
+                with open(size_path / f"train{i+1}.txt", "w") as f:
+                    f.writelines(selected)
 
-            with open(size_path / f"train{i+1}.txt", "w") as f:
-                f.writelines(selected)
+    save_splits(splits_file, len(lines), splits)
 
 
 if __name__ == "__main__":
@@ -53,7 +141,19 @@ if __name__ == "__main__":
         default="trainMaster.txt",
         help="Unix-style path to the trainMaster.txt file.",
     )
+    parser.add_argument(
+        "--seed",
+        action="store",
+        type=int,
+        default=None,
+        help="Seed for selecting the subsets.",
+    )
+    parser.add_argument(
+        "--write-text",
+        action="store_true",
+        help="Also write the selected lines of each subset to a text file.",
+    )
 
     args = parser.parse_args()
 
-    create_training_splits(args.train_file)
+    create_training_splits(args.train_file, args.seed, args.write_text)
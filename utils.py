@@ -1,10 +1,169 @@
 """Helper functions.
 """
 
+from bisect import bisect_right
+from itertools import accumulate, islice, repeat
+import os
 import random
 
 
-def choice(population: list, weights: list):
+def popcount(x: int) -> int:
+    """Return the number of set bits of a non-negative integer."""
+    return bin(x).count("1")
+
+
+# int.bit_count is only available from Python 3.10 onwards
+popcount = getattr(int, "bit_count", popcount)
+
+
+def batched(iterable, n: int):
+    """Split an iterable into lists of n consecutive items.
+
+    Parameters
+    ----------
+    iterable : Iterable[Any]
+        The items, which are consumed lazily.
+    n : int
+        Number of items per list.
+
+    Yields
+    ------
+    list[Any]
+        The next n items, or fewer at the end of the iterable.
+    """
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_rng(seed=None) -> random.Random:
+    """Return a random number generator for a seed.
+
+    Parameters
+    ----------
+    seed : int | random.Random | None, optional
+        Seed for a new generator, or an existing generator to reuse, by
+            default None, which seeds from system entropy.
+
+    Returns
+    -------
+    random.Random
+        A random number generator.
+    """
+    if isinstance(seed, random.Random):
+        return seed
+    return random.Random(seed)
+
+
+class Sampler:
+    """Draw indices from a fixed discrete distribution.
+
+    The weights are normalized once into cumulative sums so that each draw is
+    a binary search instead of a linear scan. Uniform weights skip the table
+    altogether.
+
+    Attributes
+    ----------
+    n : int
+        Number of indices that can be drawn.
+    rng : random.Random
+        Random number generator used for the draws.
+
+    Usage
+    -----
+    >>> sampler = Sampler.uniform(5, seed=0)
+    >>> sampler.sample(3)
+    ... [4, 3, 2]
+    >>> Sampler([1, 0, 3], seed=0).sample(4)
+    ... [2, 2, 2, 2]
+    """
+
+    def __init__(self, weights: list, seed=None) -> None:
+        """Create a sampler.
+
+        Parameters
+        ----------
+        weights : list[float | int]
+            Weights given to each index.
+        seed : int | random.Random | None, optional
+            Seed or generator used for the draws, by default None.
+
+        Raises
+        ------
+        ValueError
+            If weights is empty, contains negative values or sums to zero.
+        """
+        weights = list(weights)
+        if not weights:
+            raise ValueError("Cannot sample from an empty population.")
+        if min(weights) < 0:
+            raise ValueError("Weights must be non-negative.")
+
+        self.n = len(weights)
+        self.rng = get_rng(seed)
+
+        if all(w == weights[0] for w in weights):
+            self._cum = None
+        else:
+            self._cum = list(accumulate(weights))
+        total = weights[0] * self.n if self._cum is None else self._cum[-1]
+        if total <= 0:
+            raise ValueError("Weights must not sum to zero.")
+
+    @classmethod
+    def uniform(cls, n: int, seed=None) -> "Sampler":
+        """Create a sampler which draws each of n indices with equal weight.
+
+        Parameters
+        ----------
+        n : int
+            Number of indices.
+        seed : int | random.Random | None, optional
+            Seed or generator used for the draws, by default None.
+
+        Returns
+        -------
+        Sampler
+            The sampler.
+        """
+        return cls(repeat(1, n), seed)
+
+    def sample(self, k: int = 1, as_numpy: bool = False):
+        """Draw k indices with replacement.
+
+        Parameters
+        ----------
+        k : int, optional
+            Number of indices to draw, by default 1.
+        as_numpy : bool, optional
+            If true, return a NumPy array instead of a list, by default False.
+
+        Returns
+        -------
+        list[int] | numpy.ndarray
+            The drawn indices.
+        """
+        rand = self.rng.random
+        n = self.n
+        if self._cum is None:
+            idx = [int(rand() * n) for _ in repeat(None, k)]
+        else:
+            cum = self._cum
+            total = cum[-1]
+            hi = n - 1
+            idx = [bisect_right(cum, rand() * total, 0, hi) for _ in repeat(None, k)]
+
+        if as_numpy:
+            import numpy as np
+
+            return np.array(idx, dtype=np.intp)
+        return idx
+
+
+def choice(population: list, weights: list, seed=None):
     """Choose an element from a population given probabilistic weights.
 
     Parameters
@@ -13,6 +172,8 @@ def choice(population: list, weights: list):
         A population to choose an element from.
     weights : list[float | int]
         Weights given to the choice.
+    seed : int | random.Random | None, optional
+        Seed or generator used for the draw, by default None.
 
     Returns
     -------
@@ -24,23 +185,10 @@ def choice(population: list, weights: list):
     TypeError
         If population and weights are not lists.
     """
-    if not (isinstance(population, list) and isinstance(weights, list)):
-        raise TypeError("Parameters for choice() should be type list.")
-    s = sum(weights)
-    weights = [w / s for w in weights]
-
-    f = random.random()
-
-    i = 0
-    c = 0
-    while c < f:
-        c += weights[i]
-        i += 1
+    return choices(population, weights, 1, seed)[0]
 
-    return population[i - 1]
 
-
-def choices(population: list, weights: list, k: int = 1):
+def choices(population: list, weights: list, k: int = 1, seed=None):
     """Choose k elements from a population given probabilistic weights.
 
     Parameters
@@ -51,10 +199,152 @@ def choices(population: list, weights: list, k: int = 1):
         Weights given to the choice.
     k : int
         Number of elements to choose. Defaults to 1.
+    seed : int | random.Random | None, optional
+        Seed or generator used for the draws, by default None.
 
     Returns
     -------
     list[Any]
         Returns an element of population.
+
+    Raises
+    ------
+    TypeError
+        If population and weights are not lists.
+    ValueError
+        If population and weights differ in length.
+    """
+    if not (isinstance(population, list) and isinstance(weights, list)):
+        raise TypeError("Parameters for choice() should be type list.")
+    if len(population) != len(weights):
+        raise ValueError(
+            "Length of population and weights must be equal, but got "
+            f"{len(population)} elements and {len(weights)} weights."
+        )
+
+    return [population[i] for i in Sampler(weights, seed).sample(k)]
+
+
+class ResultWriter:
+    """Buffered, resumable writer of comma-separated result rows.
+
+    Rows are held in memory and appended to the file in batches. Each row is
+    identified by the values of its key columns, so a run which was stopped
+    can be resumed by skipping the rows which are already in the file.
+
+    Attributes
+    ----------
+    path : str
+        Location of the results file.
+    header : list[str]
+        Names of the columns.
+    key : list[str]
+        Names of the columns which identify a row.
+    flush_every : int
+        Number of rows buffered before they are written.
+    done : set[tuple[str, ...]]
+        Keys of the rows which have been written or buffered.
+
+    Usage
+    -----
+    >>> with ResultWriter("out.csv", ["a", "b", "value"], ["a", "b"], True) as w:
+    ...     if not w.is_done(0, 1):
+    ...         w.write([0, 1, 0.5])
     """
-    return [choice(population, weights) for _ in range(k)]
+
+    def __init__(
+        self,
+        path: str,
+        header: list,
+        key: list,
+        resume: bool = False,
+        flush_every: int = 100,
+    ) -> None:
+        """Open a results file.
+
+        Parameters
+        ----------
+        path : str
+            Location of the results file.
+        header : list[str]
+            Names of the columns.
+        key : list[str]
+            Names of the columns which identify a row.
+        resume : bool, optional
+            If true and the file exists, keep its rows and append to it, by
+            default False, which truncates the file.
+        flush_every : int, optional
+            Number of rows buffered before they are written, by default 100.
+
+        Raises
+        ------
+        ValueError
+            If resuming a file whose header differs from header.
+        """
+        self.path = path
+        self.header = list(header)
+        self.key = [self.header.index(k) for k in key]
+        self.flush_every = flush_every
+        self.done = set()
+        self._buffer = []
+
+        if resume and os.path.exists(path):
+            self._recover()
+        else:
+            with open(path, "w") as f:
+                f.write(",".join(self.header) + "\n")
+
+    def _recover(self) -> None:
+        """Read the keys of complete rows and drop a partially written one."""
+        with open(self.path, "r") as f:
+            lines = f.readlines()
+        if not lines or lines[0].rstrip("\n").split(",") != self.header:
+            raise ValueError(
+                f"Cannot resume {self.path}, its header is not {self.header}."
+            )
+
+        size = len(lines[0])
+        for line in lines[1:]:
+            values = line.rstrip("\n").split(",")
+            if not line.endswith("\n") or len(values) != len(self.header):
+                break
+            self.done.add(tuple(values[k] for k in self.key))
+            size += len(line)
+
+        with open(self.path, "r+") as f:
+            f.truncate(size)
+
+    def is_done(self, *key) -> bool:
+        """Return whether the row with the given key values was written."""
+        return tuple(str(k) for k in key) in self.done
+
+    def write(self, row: list) -> None:
+        """Buffer a row, writing the buffer once it is full.
+
+        Parameters
+        ----------
+        row : list[Any]
+            Values of the row, one for each column.
+        """
+        row = [str(v) for v in row]
+        self.done.add(tuple(row[k] for k in self.key))
+        self._buffer.append(",".join(row) + "\n")
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """Append the buffered rows to the file."""
+        if self._buffer:
+            with open(self.path, "a") as f:
+                f.writelines(self._buffer)
+            self._buffer.clear()
+
+    def close(self) -> None:
+        """Write any buffered rows."""
+        self.flush()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()